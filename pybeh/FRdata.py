@@ -1,20 +1,84 @@
 from collections import OrderedDict
+from operator import attrgetter
+import numpy as np
 
-def FRdata(events = None):
+def FRdata(events = None, as_recarray = False):
     """
     FRdata
 
-    Makes a dictionary out of events structure with each values as lists"""
-    dict = OrderedDict()
-    if events == None:
+    Makes a dictionary out of events structure, with one typed numpy array per field. Fields are converted column by
+    column, so that each field is read in a single pass over the events.
+
+    INPUTS:
+        events:         the output of scipy.io.loadmat for an events file, i.e. a dictionary whose 'events' entry
+                        is a MATLAB struct array of events. Both struct_as_record=True (the loadmat default) and
+                        struct_as_record=False are supported.
+
+        as_recarray:    if True, returns a numpy record array with one record per event instead of a dictionary,
+                        which can be passed directly to create_data. (Default == False)
+
+    OUTPUTS:
+        data:           an ordered dictionary mapping each field name to an array with one value per event, or a
+                        record array with the same field names if as_recarray is True. Numeric fields become numeric
+                        arrays and text fields become string arrays; fields mixing types are kept as object arrays.
+    """
+    if events is None:
         raise Exception('You must pass an events file.')
 
-    if len(events['events']) < 1:
+    if len(np.ravel(events['events'])) < 1:
         raise Exception('Events file empty')
-    for num in range(len(events['events'])):
-        for item in events['events'][num].__dict__['_fieldnames']:
-            if item not in dict:
-                dict[item] = [events['events'][num].__dict__[item]]
-            else:
-                dict[item].append(events['events'][num].__dict__[item])
-    return dict
\ No newline at end of file
+
+    data = event_columns(events['events'])
+
+    if as_recarray:
+        return np.rec.fromarrays(list(data.values()), names=list(data.keys()))
+    return data
+
+
+def event_columns(events):
+    """
+    Returns the fields of an events structure as an ordered dictionary of typed numpy arrays.
+
+    :param events: A MATLAB struct array of events, as loaded by scipy.io.loadmat with either struct_as_record=True or
+        struct_as_record=False. A record array, or a dictionary that already maps field names to arrays (e.g. the
+        output of FRdata), is also accepted.
+    :return: An ordered dictionary mapping each field name to an array with one value per event.
+    """
+    if isinstance(events, dict):
+        return events
+
+    events = np.ravel(events)
+    data = OrderedDict()
+    if events.dtype.names is not None:
+        # Struct arrays loaded with struct_as_record=True can be sliced by field name directly
+        for field in events.dtype.names:
+            data[field] = _column(events[field]) if events.dtype[field] == object else events[field]
+    elif len(events) > 0:
+        # Struct arrays loaded with struct_as_record=False are arrays of mat_struct objects
+        for field in events[0]._fieldnames:
+            data[field] = _column(map(attrgetter(field), events))
+    return data
+
+
+def _column(values):
+    """Converts the values of one field, across all events, into a typed numpy array."""
+    values = [_scalar(value) for value in values]
+    # Text mixed with other types (e.g. numbers or missing values) cannot be stored in a string array
+    is_text = [isinstance(value, str) for value in values]
+    if not any(is_text) or all(is_text):
+        column = np.array(values)
+        if column.ndim == 1 and column.dtype != object:
+            return column
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def _scalar(value):
+    """Unwraps the 1x1 and empty arrays that scipy.io.loadmat produces for MATLAB scalars and empty values."""
+    if isinstance(value, np.ndarray):
+        if value.size == 1:
+            return value.item()
+        if value.size == 0:
+            return '' if value.dtype.kind in 'US' else np.nan
+    return value
@@ -1,3 +1,6 @@
 """pybeh - The Python behavioral analysis toolbox."""
 packages = ('pybeh')
+__version__ = '0.0.1'
 
+from .result_cache import disable_cache, enable_cache
+from .runner import run
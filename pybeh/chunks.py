@@ -0,0 +1,40 @@
+import numpy as np
+from pybeh.ragged import RaggedArray
+
+
+def row_chunks(n_rows, chunk_size=None):
+    """
+    Splits the rows of a matrix into consecutive chunks, so that analyses can process matrices (e.g. memory-mapped
+    arrays larger than RAM) a few rows at a time, with bounded peak memory.
+
+    :param n_rows: The number of rows to split.
+    :param chunk_size: The maximum number of rows in each chunk. If None, all rows form a single chunk.
+
+    :return: A generator of slices, one per chunk.
+    """
+    if chunk_size is None:
+        yield slice(0, n_rows)
+        return
+    if not isinstance(chunk_size, (int, np.integer)) or chunk_size < 1:
+        raise ValueError('chunk_size must be a positive integer.')
+    for start in range(0, n_rows, chunk_size):
+        yield slice(start, min(start + chunk_size, n_rows))
+
+
+def as_matrix(matrix):
+    """Converts a matrix to a numpy array without copying it. None and RaggedArrays are returned unchanged."""
+    if matrix is None or isinstance(matrix, RaggedArray):
+        return matrix
+    return np.asarray(matrix)
+
+
+def take_rows(matrix, rows):
+    """
+    Returns the given rows (a slice) of a matrix converted with as_matrix. Arrays are sliced without copying, and all
+    rows of a RaggedArray are returned without copying.
+    """
+    if matrix is None:
+        return None
+    if isinstance(matrix, RaggedArray) and rows == slice(0, len(matrix)):
+        return matrix
+    return matrix[rows]
@@ -0,0 +1,239 @@
+import argparse
+import ast
+import glob
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+from .create_data import create_data
+from .data_cache import load_data, load_events, _cache_name
+from .dataset import RecallDataset
+from .export import ResultWriter, tidy
+from .read_events import read_events
+from .result_cache import enable_cache
+from .runner import ANALYSES, DEFAULT_ANALYSES, run
+
+# Extensions of the events files read with read_events; all other files are read as MATLAB events (see load_events)
+TABLE_EXTENSIONS = ('.parquet', '.feather', '.arrow', '.ipc')
+
+# Matrices that some analyses need but events files cannot supply, mapped to the analyses that need them. They are read
+# from .npy files given with the option of the same name (e.g. --dist-mat)
+MATRIX_ARGUMENTS = OrderedDict([
+    ('dist_mat', ['dist_fact']),
+    ('sem_sims', ['sem_crp']),
+])
+
+
+def main(argv=None):
+    """
+    Entry point of the pybeh command, which computes analyses for a set of events files and writes the results of every
+    file to a single long-format table. Run pybeh --help for its arguments.
+    """
+    parser = argparse.ArgumentParser(
+        prog='pybeh', description='Computes free recall analyses for a set of events files, and writes the results of '
+                                  'every file to a single Parquet or HDF5 table with the columns file, analysis, '
+                                  'subject, position and value.')
+    parser.add_argument('events', nargs='+',
+                        help='events files, directories of events files, or glob patterns (e.g. "data/*.mat"). '
+                             'MATLAB events files are read with load_events, and Parquet and Feather files with '
+                             'read_events.')
+    parser.add_argument('-o', '--output', required=True,
+                        help='the results file. Files ending in .h5, .hdf5 or .hdf are written as HDF5, and all other '
+                             'files as Parquet.')
+    parser.add_argument('-a', '--analyses', nargs='+', default=DEFAULT_ANALYSES, metavar='ANALYSIS',
+                        help='the analyses to compute, from: ' + ', '.join(ANALYSES) +
+                             '. (Default: ' + ' '.join(DEFAULT_ANALYSES) + ')')
+    parser.add_argument('-p', '--param', action='append', default=[], metavar='NAME=VALUE',
+                        help='a parameter of the analyses, e.g. lag_num=5, or of a single analysis, e.g. pnr.n=2. '
+                             'Values are read as Python literals, or as strings. Can be repeated.')
+    parser.add_argument('--dist-mat', metavar='PATH',
+                        help='a .npy file holding the N x N matrix of distances (or similarities) between the words of '
+                             'the wordpool, required by dist_fact.')
+    parser.add_argument('--sem-sims', metavar='PATH',
+                        help='a .npy file holding the N x N matrix of semantic similarities between the words of the '
+                             'wordpool, required by sem_crp.')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of files processed in parallel; -1 uses every CPU. (Default: 1)')
+    parser.add_argument('--cache-dir',
+                        help='(optional) directory in which the data converted from each events file is cached (see '
+                             'load_data), so that unchanged files are not converted again on later runs.')
+    parser.add_argument('--result-cache', metavar='DIR',
+                        help='(optional) directory in which the results of the analyses are cached (see '
+                             'result_cache.enable_cache), so that analyses of unchanged files are not computed again.')
+    parser.add_argument('--pattern', default='*.mat',
+                        help='the events files to read from each directory. (Default: *.mat)')
+    parser.add_argument('--trial-field', default='trial',
+                        help='the events field specifying which trial an event belongs to. (Default: trial)')
+    parser.add_argument('--subject-field', default='subjid',
+                        help='the data field (or comma-separated fields, e.g. subjid,session) the results are '
+                             'computed for. (Default: subjid)')
+    args = parser.parse_args(argv)
+
+    unknown = [analysis for analysis in args.analyses if analysis not in ANALYSES]
+    if unknown:
+        parser.error('unknown analyses: ' + ', '.join(unknown) + '. Choose from ' + ', '.join(ANALYSES) + '.')
+    try:
+        params = parse_params(args.param)
+    except ValueError as e:
+        parser.error(str(e))
+    for name, needed_by in MATRIX_ARGUMENTS.items():
+        path = getattr(args, name)
+        if path is not None:
+            if not os.path.isfile(path):
+                parser.error('no such file: ' + path + '.')
+            params[name] = os.path.abspath(path)
+        for analysis in needed_by:
+            if analysis in args.analyses and name not in params and name not in params.get(analysis, {}):
+                parser.error(analysis + ' requires --' + name.replace('_', '-') + '.')
+    files = find_files(args.events, pattern=args.pattern)
+    if not files:
+        parser.error('no events files found.')
+    subject_field = tuple(args.subject_field.split(',')) if ',' in args.subject_field else args.subject_field
+
+    process = partial(process_file, analyses=args.analyses, params=params, cache_dir=args.cache_dir,
+                      result_cache=args.result_cache, trial_field=args.trial_field, subject_field=subject_field)
+    n_files = 0
+    n_errors = 0
+    with ResultWriter(args.output) as writer:
+        if args.jobs == 1:
+            outputs = map(process, files)
+        else:
+            pool = ProcessPoolExecutor(max_workers=os.cpu_count() if args.jobs < 0 else args.jobs)
+            outputs = pool.map(process, files)
+        try:
+            # A file or analysis that fails is reported, and the results of the others are still written
+            for path, (columns, errors) in zip(files, outputs):
+                for error in errors:
+                    print('pybeh: ' + path + ': ' + error, file=sys.stderr)
+                n_errors += len(errors)
+                if columns is not None:
+                    writer.write_columns(columns)
+                    n_files += 1
+        finally:
+            if args.jobs != 1:
+                pool.shutdown()
+    print('Wrote {} rows for {} of {} events files to {}.'.format(writer.n_rows, n_files, len(files), args.output))
+    if n_errors:
+        print('pybeh: {} errors; see above.'.format(n_errors), file=sys.stderr)
+        return 1
+    return 0
+
+
+def process_file(path=None, analyses=None, params=None, cache_dir=None, result_cache=None, trial_field='trial',
+                 subject_field='subjid'):
+    """
+    Converts an events file with create_data and computes the given analyses for it with run.
+
+    INPUTS:
+        path:           path to an events file.
+        analyses:       the names of the analyses to compute (see runner.ANALYSES).
+        params:         (optional) a dictionary of parameters of the analyses (see run). The parameters named in
+                        MATRIX_ARGUMENTS are paths to .npy files, which are loaded (memory-mapped) before the analyses
+                        are run.
+        cache_dir:      (optional) a directory in which the converted data are cached (see load_data). Each file is
+                        cached in its own subdirectory, so that several files can be processed in parallel.
+        result_cache:   (optional) a directory in which the results of the analyses are cached (see
+                        result_cache.enable_cache).
+        trial_field:    field within the events structure specifying which trial an event belongs to.
+        subject_field:  the data field (or tuple of fields) the results are computed for.
+
+    OUTPUTS:
+        columns:        a dictionary of long-format columns (file, analysis, one column per subject field, position and
+                        value) holding the results of every analysis that succeeded, or None if there are none (e.g.
+                        the file has no trials).
+        errors:         a list of messages describing the errors raised while reading the file or computing each
+                        analysis. An analysis that fails does not prevent the others from being computed.
+    """
+    if path is None:
+        raise Exception('You must pass a path to an events file.')
+    if path.lower().endswith(TABLE_EXTENSIONS):
+        loader = partial(read_events, trial_field=trial_field)
+    else:
+        loader = load_events
+    params = dict(params or {})
+    try:
+        for name in MATRIX_ARGUMENTS:
+            if isinstance(params.get(name), str):
+                params[name] = np.load(params[name], mmap_mode='r')
+        if cache_dir is not None:
+            data = load_data([path], cache_dir=os.path.join(cache_dir, os.path.splitext(_cache_name(path))[0]),
+                             trial_field=trial_field, loader=loader)
+        else:
+            data = create_data(loader(path), trial_field=trial_field)
+    except Exception as e:
+        return None, [_describe(e)]
+    if not data:
+        return None, []
+    if result_cache is not None:
+        enable_cache(result_cache)
+
+    # Each analysis is run separately, so that one failure does not lose the others; they still share the dataset's
+    # intermediates
+    dataset = RecallDataset(data, subject_field=subject_field)
+    batches = []
+    errors = []
+    for name in analyses:
+        try:
+            result = run(dataset, [name], **params)[name]
+            columns = tidy(result, dataset.groups)
+        except Exception as e:
+            errors.append(name + ': ' + _describe(e))
+            continue
+        n_rows = len(columns['value'])
+        batch = {'file': np.repeat(path, n_rows), 'analysis': np.repeat(name, n_rows)}
+        batch.update((key, column) for key, column in columns.items() if key not in ('position', 'value'))
+        batch['position'] = columns.get('position', np.zeros(n_rows, dtype=int)).astype(np.int64)
+        batch['value'] = columns['value'].astype(float)
+        batches.append(batch)
+    if not batches:
+        return None, errors
+    return {key: np.concatenate([batch[key] for batch in batches]) for key in batches[0]}, errors
+
+
+def find_files(paths=None, pattern='*.mat'):
+    """
+    Expands a list of events files, directories and glob patterns into a list of absolute paths, without duplicates.
+    Directories and patterns contribute the files that match them, sorted by name.
+    """
+    files = []
+    for path in paths or []:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, pattern))))
+        elif any(char in path for char in '*?['):
+            files.extend(sorted(glob.glob(path)))
+        else:
+            files.append(path)
+    files = [os.path.abspath(path) for path in files]
+    return list(OrderedDict.fromkeys(files))
+
+
+def parse_params(items=None):
+    """
+    Parses NAME=VALUE strings into a dictionary of parameters for run. ANALYSIS.NAME=VALUE sets a parameter of a single
+    analysis, and values that are not Python literals are kept as strings.
+    """
+    params = dict()
+    for item in items or []:
+        if '=' not in item:
+            raise ValueError('parameters must be given as NAME=VALUE, not ' + item + '.')
+        name, value = item.split('=', 1)
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            pass
+        if '.' in name:
+            analysis, name = name.split('.', 1)
+            params.setdefault(analysis, dict())[name] = value
+        else:
+            params[name] = value
+    return params
+
+
+def _describe(error):
+    return type(error).__name__ + ': ' + str(error)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
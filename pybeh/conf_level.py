@@ -1,36 +1,29 @@
 from __future__ import division
 import numpy as np
+from pybeh.FRdata import event_columns
 
 
 def conf_level(events, level):
     """
     INPUTS:
-        events:     recog_events structure
+        events:     recog_events structure, or a dictionary of its fields (e.g. from FRdata)
         level:      scalar value of level of confidence level available
     OUTPUTS:
         conf_level: a matrix of confidence percentage with subj for rows and levels for columns
     """
 
-    result = [0] * level
-    if len(events) < 1:
+    events = event_columns(events)
+    if not events or len(events['recog_conf']) < 1:
         raise Exception('events file is empty')
-    for num in range(len(events)):
-        if np.isnan(events[num].__dict__['recog_conf']) or (
-                    events[num].__dict__['recog_conf'] < 1) or (events[num].__dict__['recog_conf'] > 5):
-            continue
-        if events[num].__dict__['recog_conf'] == 'nan':
-            continue
-        if events[num].__dict__['recog_rt'] == 0:
-            continue
-        result[int(events[num].__dict__['recog_conf']) - 1] += 1
-
-    total = 0
-    for item in result:
-        total += item
-
-    for num, item in enumerate(result):
-        result[num] = item / float(total)
-    return result
+
+    # Only count responses with a valid confidence rating and a nonzero reaction time
+    conf = np.asarray(events['recog_conf'], dtype=float)
+    valid = (conf >= 1) & (conf <= 5) & (np.asarray(events['recog_rt']) != 0)
+    result = np.bincount(conf[valid].astype(int) - 1, minlength=level)
+
+    total = np.sum(result)
+
+    return (result / float(total)).tolist()
 
     #If data is already in an int structure of rows for subjects and confidence values as columns, use code below
 
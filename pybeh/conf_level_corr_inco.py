@@ -1,43 +1,32 @@
 from __future__ import division
 import numpy as np
+from pybeh.FRdata import event_columns
 
 def conf_level_corr_inco(events, level):
     """
     INPUTS:
-        events:     recog_events structure
+        events:     recog_events structure, or a dictionary of its fields (e.g. from FRdata)
         level:      scalar value of level of confidence level available
     OUTPUTS:
         conf_level: a matrix of confidence percentage with subj for rows and levels for columns
     """
-    corr_result = [0] * level
-    inco_result = [0] * level
-    if len(events) < 1:
+    events = event_columns(events)
+    if not events or len(events['recog_conf']) < 1:
         raise Exception('events file is empty')
-    for num in range(len(events)):
-        if np.isnan(events[num].__dict__['recog_conf']) or (
-                    events[num].__dict__['recog_conf'] < 1) or (events[num].__dict__['recog_conf'] > 5):
-            continue
 
-        if events[num].__dict__['recog_conf'] == 'nan':
-            continue
-        if events[num].__dict__['recog_rt'] == 0:
-            continue
-        if events[num].__dict__['recog_resp'] == 1 and events[num].__dict__['type'] == 'RECOG_TARGET':
-            corr_result[int(events[num].__dict__['recog_conf']) - 1] += 1
-        elif events[num].__dict__['recog_resp'] == 0 and events[num].__dict__['type'] == 'RECOG_LURE':
-            corr_result[int(events[num].__dict__['recog_conf']) - 1] += 1
-        elif events[num].__dict__['recog_resp'] == 1 and events[num].__dict__['type'] == 'RECOG_LURE':
-            inco_result[int(events[num].__dict__['recog_conf']) - 1] += 1
-        elif events[num].__dict__['recog_resp'] == 0 and events[num].__dict__['type'] == 'RECOG_TARGET':
-            inco_result[int(events[num].__dict__['recog_conf']) - 1] += 1
-    total = 0
-    for item in corr_result:
-        total += item
-    for item in inco_result:
-        total += item
+    # Only count responses with a valid confidence rating and a nonzero reaction time
+    conf = np.asarray(events['recog_conf'], dtype=float)
+    valid = (conf >= 1) & (conf <= 5) & (np.asarray(events['recog_rt']) != 0)
+    conf = conf[valid].astype(int)
+    resp = np.asarray(events['recog_resp'])[valid]
+    types = np.asarray(events['type'])[valid]
 
-    for num, item in enumerate(corr_result):
-        corr_result[num] = item / float(total)
-    for num, item in enumerate(inco_result):
-        inco_result[num] = item / float(total)
-    return corr_result, inco_result
\ No newline at end of file
+    # Correct responses are hits and correct rejections; incorrect responses are false alarms and misses
+    correct = ((resp == 1) & (types == 'RECOG_TARGET')) | ((resp == 0) & (types == 'RECOG_LURE'))
+    incorrect = ((resp == 1) & (types == 'RECOG_LURE')) | ((resp == 0) & (types == 'RECOG_TARGET'))
+    corr_result = np.bincount(conf[correct] - 1, minlength=level)
+    inco_result = np.bincount(conf[incorrect] - 1, minlength=level)
+
+    total = np.sum(corr_result) + np.sum(inco_result)
+
+    return (corr_result / float(total)).tolist(), (inco_result / float(total)).tolist()
@@ -1,9 +1,28 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from itertools import repeat
 import numpy as np
 from .events2data import events2data
 from .make_recalls_matrix import make_recalls_matrix
 from .create_intrusions import intrusions
+from .ragged import RaggedArray
 
-def create_data(events=None, trial_field=None):
+# Fields with one entry per recall, which are stored as RaggedArrays when create_data is called with ragged=True
+RECALL_FIELDS = ['rec_items', 'rec_itemnos', 'recalls', 'times', 'intrusions']
+
+# Integer dtypes tried, from smallest to largest, for each field when create_data is called with compact=True
+COMPACT_DTYPES = {
+    'subject': (np.int8, np.int16, np.int32),
+    'session': (np.int8, np.int16, np.int32),
+    'pres_itemnos': (np.int16, np.int32),
+    'rec_itemnos': (np.int16, np.int32),
+    'recalls': (np.int8, np.int16),
+    'times': (np.int32,),
+    'intrusions': (np.int8, np.int16),
+}
+
+def create_data(events=None, trial_field=None, n_jobs=None, executor=None, ragged=False, compact=False):
 
     '''
 
@@ -41,6 +60,18 @@ def create_data(events=None, trial_field=None):
     :param events: events structure (e.g., from ptsa BaseEventReader)
     :param trial_field: field within the events structure specifying
            which trial an event belongs to (e.g., list, trial)
+    :param n_jobs: number of worker processes used to convert subjects in
+           parallel. If None or 1, subjects are converted serially; if -1,
+           one worker is started per CPU.
+    :param executor: (optional) a concurrent.futures executor used to
+           convert subjects in parallel, instead of starting a process
+           pool. Overrides n_jobs.
+    :param ragged: if True, the recall fields (rec_items, rec_itemnos,
+           recalls, times and intrusions) are returned as RaggedArrays
+           holding only the recalls made on each trial, instead of
+           matrices padded to the longest recall sequence.
+    :param compact: if True, numeric fields are stored in the smallest
+           integer dtypes that hold them (see compact_data).
     :return data: data structure as described above
     '''
 
@@ -57,90 +88,179 @@ def create_data(events=None, trial_field=None):
     if not any(np.array(events.dtype.names)=='type'):
         raise Exception('Events must have a type field')
 
-    subjects = np.unique(events['subject'])
-
-    for subject in subjects:
-
-        subject_number = subject[findNumbers(subject)]
-        # get free recall events for this subject
-        subject_events = events[(events['subject']==subject) & ((events['type']=='WORD') | (events['type']=='REC_WORD'))]
-
-        # remove vocalizations
-        subject_events = subject_events[subject_events['item'] != 'VV']
-
-        sessions = np.unique([subject_events.session])
-
-        for session in sessions:
-
-            sess_data = dict()
-            sess_events = subject_events[subject_events['session']==session]
-
-            trials = sess_events[trial_field]
-            unique_trials = np.unique(trials)
-
-            # presentation data
-            item_pres = sess_events['type'] == 'WORD'
+    # get free recall events, and remove vocalizations
+    fr_events = events[((events['type'] == 'WORD') | (events['type'] == 'REC_WORD')) & (events['item'] != 'VV')]
 
-            if not any(item_pres):
-                raise Exception('No presentation events in session '+str(session)+' for subject '+subject)
+    # partition the events by subject with a single stable sort, so that events keep their original order within each
+    # session
+    fr_events = fr_events[np.lexsort((fr_events['session'], fr_events['subject']))]
+    subject_starts = np.flatnonzero(np.append(True, fr_events['subject'][1:] != fr_events['subject'][:-1]))
+    subject_events = np.split(fr_events, subject_starts[1:]) if len(fr_events) else []
 
-            pres_data = events2data(events=sess_events[item_pres], index=trials[item_pres], index_rows=unique_trials)
-            n_trials = np.shape(pres_data['itemno'])[0]
-            n_items = np.shape(pres_data['itemno'])[1]
+    # convert each subject's sessions, in parallel if requested; results are kept in subject order
+    args = (subject_events, repeat(trial_field), repeat(events.dtype), repeat(ragged), repeat(compact))
+    if executor is not None:
+        subjects = list(executor.map(subject_data, *args))
+    elif n_jobs is not None and n_jobs != 1:
+        with ProcessPoolExecutor(max_workers=os.cpu_count() if n_jobs < 0 else n_jobs) as pool:
+            subjects = list(pool.map(subject_data, *args))
+    else:
+        subjects = list(map(subject_data, *args))
 
-            # recall data
-            recalls = sess_events['type'] == 'REC_WORD'
-            rec_data = events2data(events=sess_events[recalls], index=trials[recalls], index_rows=unique_trials)
+    sessions = [sess_data for subject in subjects for sess_data in subject]
+    return concatenate_sessions(sessions)
 
-            if not any(recalls):
-                for field in events.dtype.names:
-                    if events[field].dtype.type is np.string_:
-                        rec_data[field] = np.empty(np.shape(rec_data[field]), dtype=events[field].dtype)
-                        rec_data[field].fill('')
 
-            # initialize session data
-            sess_data['subject'] = np.empty([n_trials, 1])
-            sess_data['subject'].fill(subject_number)
-
-            sess_data['subjid'] = pres_data['subject']
-            sess_data['session'] = pres_data['session']
-
-            sess_data['pres_items'] = pres_data['item']
-            sess_data['pres_itemnos'] = pres_data['itemno']
-
-            sess_data['rec_items'] = rec_data['item']
-            sess_data['rec_itemnos'] = rec_data['itemno']
-
-            sess_data['recalls'] = make_recalls_matrix(sess_data['pres_itemnos'], sess_data['rec_itemnos'])
-
-            if any(np.array(list(rec_data.keys()))=='rectime'):
-                sess_data['times'] = rec_data['rectime']
-
-            sess_data['session'] = sess_data['session'][:,0]
-
-            sess_data['intrusions'] = intrusions(rec_itemnos=sess_data['rec_itemnos'], pres_itemnos=sess_data['pres_itemnos'],
-                                            subjects=sess_data['subject'], sessions=sess_data['session'])
-
-            sess_data['listLength'] = n_items
-            # sess_data['pres'] = pres_data
-            # sess_data['rec'] = rec_data
+def subject_data(subject_events, trial_field, dtype, ragged=False, compact=False):
+    """
+    Converts the events from a single subject, sorted by session, into a list of data structures with one entry per
+    session (see session_data).
+    """
+    new_session = np.append(True, subject_events['session'][1:] != subject_events['session'][:-1])
+    return [session_data(sess_events, sess_events['subject'][0], sess_events['session'][0], trial_field, dtype, ragged,
+                         compact)
+            for sess_events in np.split(subject_events, np.flatnonzero(new_session)[1:])]
+
+
+def session_data(sess_events, subject, session, trial_field, dtype, ragged=False, compact=False):
+    """Converts the presentation and recall events from a single session into the data fields of create_data."""
+    subject_number = subject[findNumbers(subject)]
+
+    sess_data = dict()
+
+    trials = sess_events[trial_field]
+    unique_trials = np.unique(trials)
+
+    # presentation data
+    item_pres = sess_events['type'] == 'WORD'
+
+    if not any(item_pres):
+        raise Exception('No presentation events in session '+str(session)+' for subject '+subject)
+
+    pres_data = events2data(events=sess_events[item_pres], index=trials[item_pres], index_rows=unique_trials)
+    n_trials = np.shape(pres_data['itemno'])[0]
+    n_items = np.shape(pres_data['itemno'])[1]
+
+    # recall data
+    recalls = sess_events['type'] == 'REC_WORD'
+    rec_data = events2data(events=sess_events[recalls], index=trials[recalls], index_rows=unique_trials)
+
+    if not any(recalls):
+        for field in dtype.names:
+            if dtype[field].type is np.bytes_:
+                rec_data[field] = np.empty(np.shape(rec_data[field]), dtype=dtype[field])
+                rec_data[field].fill('')
+
+    # initialize session data
+    sess_data['subject'] = np.empty([n_trials, 1])
+    sess_data['subject'].fill(subject_number)
+
+    sess_data['subjid'] = pres_data['subject']
+    sess_data['session'] = pres_data['session']
+
+    sess_data['pres_items'] = pres_data['item']
+    sess_data['pres_itemnos'] = pres_data['itemno']
+
+    sess_data['rec_items'] = rec_data['item']
+    sess_data['rec_itemnos'] = rec_data['itemno']
+
+    sess_data['recalls'] = make_recalls_matrix(sess_data['pres_itemnos'], sess_data['rec_itemnos'])
+
+    if any(np.array(list(rec_data.keys()))=='rectime'):
+        sess_data['times'] = rec_data['rectime']
+
+    sess_data['session'] = sess_data['session'][:,0]
+
+    sess_data['intrusions'] = intrusions(rec_itemnos=sess_data['rec_itemnos'], pres_itemnos=sess_data['pres_itemnos'],
+                                    subjects=sess_data['subject'], sessions=sess_data['session'])
+
+    sess_data['listLength'] = n_items
+
+    if compact:
+        sess_data = compact_data(sess_data)
+
+    if ragged:
+        # Cut each trial's recall fields to the number of recall events on that trial
+        n_recalls = np.bincount(np.searchsorted(unique_trials, trials[recalls]), minlength=n_trials)
+        for key in RECALL_FIELDS:
+            if key in sess_data:
+                sess_data[key] = RaggedArray.from_padded(sess_data[key], lengths=n_recalls)
+    # sess_data['pres'] = pres_data
+    # sess_data['rec'] = rec_data
+
+    return sess_data
+
+
+def concatenate_sessions(sessions):
+    """
+    Stacks the data fields of several sessions (as returned by session_data) into a single data structure.
+
+    Each field is allocated once at its final size and filled session by session. Matrices from sessions with fewer
+    columns are padded with zeros, and RaggedArrays are concatenated without padding. Scalar fields (e.g. listLength)
+    are taken from the first session.
+    """
+    data = dict()
+    if not sessions:
+        return data
+    n_rows = [len(sess_data['session']) for sess_data in sessions]
+    row_starts = np.cumsum([0] + n_rows)
+    for key in list(sessions[0].keys()):
+        fields = [sess_data[key] for sess_data in sessions]
+        if isinstance(fields[0], RaggedArray):
+            data[key] = RaggedArray.concatenate(fields)
+            continue
+        if not np.shape(fields[0]):
+            data[key] = fields[0]
+            continue
+        shape = (row_starts[-1],) + tuple(np.max([np.shape(field)[1:] for field in fields], axis=0))
+        data[key] = np.full(shape, 0, dtype=reduce(np.promote_types, [field.dtype for field in fields]))
+        for field, start, stop in zip(fields, row_starts[:-1], row_starts[1:]):
+            data[key][(slice(start, stop),) + tuple(slice(0, n) for n in np.shape(field)[1:])] = field
+
+    return data
 
-            if (session == sessions[0]) and (subject==subjects[0]):
-                data = sess_data
-            else:
-                for key in list(sess_data.keys()):
-                    if np.shape(sess_data[key]):
-                        if len(np.shape(data[key])) != 1:
-                            d_cols = np.shape(data[key])[1]
-                            sd_cols = np.shape(sess_data[key])[1]
-                            if d_cols > sd_cols:
-                                sess_data[key] = np.pad(sess_data[key], ((0,0),(0, d_cols-sd_cols)), 'constant', constant_values=0)
-                            elif d_cols < sd_cols:
-                                data[key] = np.pad(data[key], ((0,0),(0, sd_cols-d_cols)), 'constant', constant_values=0)
 
-                        data[key] = np.concatenate((data[key],sess_data[key]), axis=0)
+def compact_data(data):
+    """
+    Returns a copy of a data structure from create_data, with its numeric fields stored in the smallest integer dtypes
+    that hold their values:
+
+    * recalls and intrusions as int8 (or int16)
+    * rec_itemnos and pres_itemnos as int16 (or int32)
+    * times as int32 milliseconds, rounded to the nearest millisecond
+    * subject and session as int8, int16 or int32
+
+    A field is left unchanged if it holds values that are not integers (e.g. NaN padding), or that do not fit in any of
+    its dtypes. Other fields are not copied. The analyses accept these dtypes directly, and compute any indices from
+    them as intp.
+    """
+    compact = dict(data)
+    for key, dtypes in COMPACT_DTYPES.items():
+        if key not in data:
+            continue
+        if isinstance(data[key], RaggedArray):
+            values = _smallest_int(data[key].values, dtypes, round_values=key == 'times')
+            compact[key] = RaggedArray(values, data[key].offsets)
+        else:
+            compact[key] = _smallest_int(np.asarray(data[key]), dtypes, round_values=key == 'times')
+    return compact
+
+
+def _smallest_int(values, dtypes, round_values=False):
+    """Casts values to the first of dtypes that holds all of them, or returns values unchanged if none does."""
+    if values.dtype.kind not in 'biuf':
+        return values
+    if round_values and values.dtype.kind == 'f':
+        values = np.rint(values)
+    if values.dtype.kind == 'f' and not np.all(np.isfinite(values) & (values == np.round(values))):
+        return values
+    low = np.min(values, initial=0)
+    high = np.max(values, initial=0)
+    for dtype in dtypes:
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+    return values
 
-    return data
 
 def findNumbers(inputString):
     out = bool()
@@ -1,4 +1,4 @@
-import copy
+import numpy as np
 
 def intrusions(rec_itemnos= None, pres_itemnos= None, subjects= None, sessions= None):
     """
@@ -38,40 +38,47 @@ def intrusions(rec_itemnos= None, pres_itemnos= None, subjects= None, sessions=
         raise Exception('rec_itemnos matrix must have the same number of rows as subjects.')
     elif len(sessions) != len(subjects):
         raise Exception('sessions vector must have the same length as subjects.')
-    result = copy.deepcopy(rec_itemnos)
-    for num, list in enumerate(rec_itemnos):
-        for index, item in enumerate(list):
-            # Extra-list intrusions
-            if item < 0:
-                result[num][index] = -1
-                #make non-recalls 0
-            # Non-recalls (coming from zero padding in recalls matrix)
-            elif item == 0:
-                result[num][index] = 0
-            # Correct recalls
-            elif item in pres_itemnos[num]:
-                result[num][index] = 0
-            # Prior-list intrusions; may also be an extra-list intrusion that happens to be in the wordpool
-            else:
-                # Start by assuming the word is an ELI that happens to be in the wordpool
-                result[num][index] = -1
+    rec_itemnos = np.asarray(rec_itemnos)
+    pres_itemnos = np.asarray(pres_itemnos)
+    subjects = np.asarray(subjects).ravel()
+    sessions = np.asarray(sessions).ravel()
 
-                # Loop backwards over previous lists from the current subject and session to determine whether the word
-                # is a PLI. If it is, replace the -1 we just wrote with a positive integer indicating the number of
-                # lists back that the PLI was made.
-                count = 1
-                while num - count >= 0:
-                    if subjects[num] == subjects[num - count] and sessions[num] == sessions[num - count]:
-                        # If the word was presented "count" lists back, then mark it as a PLI
-                        if item in pres_itemnos[num - count]:
-                            result[num][index] = count
-                            break
-                        # Otherwise, keep looping backwards through the session
-                        else:
-                            count += 1
-                    # If we go back far enough that we reach a different session or subject, then the word is an ELI
-                    # that happens to also be in the wordpool.
-                    else:
-                        break
+    # Non-recalls (coming from zero or NaN padding in recalls matrix) and correct recalls are 0, and extra-list
+    # intrusions are -1
+    result = np.zeros(rec_itemnos.shape, dtype=int)
+    result[rec_itemnos < 0] = -1
 
-    return result
\ No newline at end of file
+    # Prior-list intrusions; may also be an extra-list intrusion that happens to be in the wordpool. Start by assuming
+    # the word is an ELI that happens to be in the wordpool.
+    candidates = (rec_itemnos > 0) & ~_in_own_list(rec_itemnos, pres_itemnos)
+    result[candidates] = -1
+
+    # Walk forward through each subject's sessions, keeping track of the most recent list on which each word was
+    # presented. If a candidate word was presented earlier in the session, replace the -1 we just wrote with a
+    # positive integer indicating the number of lists back that the PLI was made.
+    new_session = np.ones(len(subjects), dtype=bool)
+    new_session[1:] = (subjects[1:] != subjects[:-1]) | (sessions[1:] != sessions[:-1])
+    candidate_rows = np.any(candidates, axis=1) if rec_itemnos.ndim > 1 else candidates
+    last_presented = {}
+    for num in range(len(rec_itemnos)):
+        # If we reach a different session or subject, then words presented before it cannot be PLIs
+        if new_session[num]:
+            last_presented = {}
+        if candidate_rows[num]:
+            for index in np.flatnonzero(candidates[num]):
+                prior_list = last_presented.get(rec_itemnos[num, index])
+                if prior_list is not None:
+                    result[num, index] = num - prior_list
+        last_presented.update(dict.fromkeys(pres_itemnos[num].tolist(), num))
+
+    return result
+
+
+def _in_own_list(rec_itemnos, pres_itemnos):
+    """Returns a mask that is True where a recalled item was presented on the same trial it was recalled on."""
+    # Give each (trial, item) pair a unique integer key, and look up the recalled pairs among the presented pairs
+    items, codes = np.unique(np.concatenate([pres_itemnos.ravel(), rec_itemnos.ravel()]), return_inverse=True)
+    codes = codes.ravel()
+    pres_keys = np.repeat(np.arange(len(pres_itemnos)), pres_itemnos.shape[1]) * items.size + codes[:pres_itemnos.size]
+    rec_keys = np.repeat(np.arange(len(rec_itemnos)), rec_itemnos.shape[1]) * items.size + codes[pres_itemnos.size:]
+    return np.isin(rec_keys, pres_keys).reshape(rec_itemnos.shape)
@@ -1,9 +1,13 @@
 from __future__ import division
 import numpy as np
-from pybeh.mask_maker import make_clean_recalls_mask2d
+from pybeh.transitions import transition_chunks
+from pybeh.dataset import accepts_dataset
+from pybeh.grouping import group_by
 
 
-def crl(recalls=None, times=None, subjects=None, listLength=None, lag_num=None, skip_first_n=0):
+@accepts_dataset
+def crl(recalls=None, times=None, subjects=None, listLength=None, lag_num=None, skip_first_n=0, transitions=None,
+        chunk_size=None):
     """
     CRL  Inter-response time as a function of lag.
 
@@ -19,8 +23,9 @@ def crl(recalls=None, times=None, subjects=None, listLength=None, lag_num=None,
         crl = crl(recalls, times, subjects, listLength, lag_num);
 
     INPUT ARGS:
-        recalls    - recall positions
-        times      - time associated with each recall
+        recalls    - recall positions (a matrix or a RaggedArray)
+        times      - time associated with each recall (with the same layout
+                     as recalls)
         subjects   - subject number associated with each trial
         listLength - number of words in the list
         lag_num    - lag number to output
@@ -30,19 +35,28 @@ def crl(recalls=None, times=None, subjects=None, listLength=None, lag_num=None,
                        biasing your results, as the first 2-3 transitions are
                        almost always temporally clustered with short IRTs.
                        (DEFAULT=0)
+        transitions  - (Optional) a TransitionTable built from the recalls and
+                       times matrices. If given, recalls and times may be
+                       omitted and the transitions are not enumerated again.
+        chunk_size   - (Optional) if given, the recalls and times matrices are
+                       processed this many rows at a time, which bounds peak
+                       memory for very large (e.g. memory-mapped) matrices.
+                       Ignored if transitions is given.
 
 
     OUTPUT ARGS:
         crl - a matrix of average crl times by lag position for each subject
     """
-    if recalls is None:
+    if recalls is None and transitions is None:
         raise Exception('You must pass a recalls matrix.')
-    if times is None:
+    if times is None and (transitions is None or transitions.irt is None):
         raise Exception('You must pass a times vector.')
     if subjects is None:
         raise Exception('You must pass a subject vector.')
     if listLength is None:
-        raise Exception('You must pass a list length.')
+        if transitions is None:
+            raise Exception('You must pass a list length.')
+        listLength = transitions.listLength
     if lag_num is None:
         lag_num = listLength - 1
     elif lag_num < 1 or lag_num >= listLength or not isinstance(lag_num, int):
@@ -50,42 +64,26 @@ def crl(recalls=None, times=None, subjects=None, listLength=None, lag_num=None,
     if not isinstance(skip_first_n, int):
         raise ValueError('skip_first_n must be an integer.')
 
-    # Convert inputs to numpy arrays
-    recalls = np.array(recalls)
-    times = np.array(times)
-    subjects = np.array(subjects)
-    # Get a list of unique subjects -- we will calculate a CRP for each
-    usub = np.unique(subjects)
+    # Group the trials by subject -- we will calculate a CRL for each -- giving the row of the result for each trial
+    groups = group_by(subjects)
+    usub, subj_idx = groups.labels, groups.index
     # Number of possible lags = (listLength - 1) * 2 + 1; e.g. a length-24 list can have lags -23 through +23
     num_lags = 2 * listLength - 1
-    # Initialize array to store the CRP for each subject (or other unique identifier)
-    result = np.zeros((usub.size, num_lags))
-    # Initialize arrays to store transition counts
-    trans_count = np.empty(num_lags)
-    time_count = np.empty(num_lags)
 
-    # For each subject/unique identifier
-    for i, subj in enumerate(usub):
-        # Reset counts for each participant
-        trans_count.fill(0)
-        time_count.fill(0)
-        cur_recs = recalls[subjects == subj]
-        cur_times = times[subjects == subj]
-        # Create trials x items matrix where item j, k indicates whether the kth recall on trial j was a correct recall
-        clean_recalls_mask = np.array(make_clean_recalls_mask2d(cur_recs))
-        # For each trial that matches that identifier
-        for j, trial_recs in enumerate(cur_recs):
-            for k, rec in enumerate(trial_recs[:-1]):
-                # Only increment transition and timing counts if the current and next recall are BOTH correct recalls
-                if clean_recalls_mask[j, k] and clean_recalls_mask[j, k + 1] and k >= skip_first_n:
-                    next_rec = trial_recs[k + 1]
-                    trans = next_rec - rec
-                    trans_time = cur_times[j, k+1] - cur_times[j, k]
-                    # Record the transition that was made and its IRT
-                    trans_count[trans + listLength - 1] += 1
-                    time_count[trans + listLength - 1] += trans_time
+    # Record the transitions that were made and their IRTs, skipping the first n transitions of each trial. Every valid
+    # transition and its IRT is enumerated in each chunk of the recalls matrix, unless this has been done already.
+    trans_count = np.zeros(usub.size * num_lags)
+    time_count = np.zeros(usub.size * num_lags)
+    for rows, chunk in transition_chunks(len(subjects), transitions, chunk_size, recalls, listLength, times=times):
+        keep = chunk.after(skip_first_n)
+        bins = subj_idx[rows][chunk.trial[keep]] * num_lags + chunk.lag[keep] + listLength - 1
+        trans_count += np.bincount(bins, minlength=usub.size * num_lags)
+        time_count += np.bincount(bins, weights=chunk.irt[keep], minlength=usub.size * num_lags)
+    trans_count = trans_count.reshape(usub.size, num_lags)
+    time_count = time_count.reshape(usub.size, num_lags)
 
-        result[i, :] = time_count / trans_count
-        result[i, trans_count == 0] = np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = time_count / trans_count
+    result[trans_count == 0] = np.nan
 
     return result[:, listLength - lag_num - 1:listLength + lag_num]
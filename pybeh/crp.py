@@ -1,9 +1,13 @@
 from __future__ import division
 import numpy as np
-from pybeh.mask_maker import make_clean_recalls_mask2d
+from pybeh.transitions import transition_chunks
+from pybeh.dataset import accepts_dataset
+from pybeh.grouping import group_by
 
 
-def crp(recalls=None, subjects=None, listLength=None, lag_num=None, skip_first_n=0):
+@accepts_dataset
+def crp(recalls=None, subjects=None, listLength=None, lag_num=None, skip_first_n=0, transitions=None,
+        chunk_size=None):
     '''
     CRP   Conditional response probability as a function of lag (lag-CRP).
     
@@ -13,7 +17,8 @@ def crp(recalls=None, subjects=None, listLength=None, lag_num=None, skip_first_n
              recalls:  A 2D iterable whose elements are serial positions of
                        recalled items.  The rows of this array should
                        represent recalls made by a single subject on a
-                       single trial.
+                       single trial. A RaggedArray of recalls may be
+                       passed instead.
     
             subjects:  A column vector which indexes the rows of "recalls"
                        with a subject number (or other identifier).  The
@@ -35,6 +40,15 @@ def crp(recalls=None, subjects=None, listLength=None, lag_num=None, skip_first_n
                        will still count as already recalled words for the
                        purposes of determining which transitions are
                        possible.  (DEFAULT=0)
+
+         transitions:  (Optional) A TransitionTable built from the recalls
+                       matrix. If given, recalls may be omitted and the
+                       transitions are not enumerated again.
+
+          chunk_size:  (Optional) If given, the recalls matrix is
+                       processed this many rows at a time, which bounds
+                       peak memory for very large (e.g. memory-mapped)
+                       matrices. Ignored if transitions is given.
     
     
       OUTPUTS:
@@ -54,13 +68,15 @@ def crp(recalls=None, subjects=None, listLength=None, lag_num=None, skip_first_n
                        lag-CRPs:     [ 0.1  0.2  0.3  NaN  0.3  0.1  0.0 ]
                        transitions:    -3   -2    -1   0    +1   +2   +3
     '''
-    if recalls is None:
+    if recalls is None and transitions is None:
         raise Exception('You must pass a recalls matrix.')
     elif subjects is None:
         raise Exception('You must pass a subjects vector.')
     elif listLength is None:
-        raise Exception('You must pass a list length.')
-    elif len(recalls) != len(subjects):
+        if transitions is None:
+            raise Exception('You must pass a list length.')
+        listLength = transitions.listLength
+    if transitions is None and len(recalls) != len(subjects):
         raise Exception('recalls matrix must have the same number of rows as subjects.')
     if lag_num is None:
         lag_num = listLength - 1
@@ -69,42 +85,60 @@ def crp(recalls=None, subjects=None, listLength=None, lag_num=None, skip_first_n
     if not isinstance(skip_first_n, int):
         raise ValueError('skip_first_n must be an integer.')
 
-    # Convert recalls and subjects to numpy arrays
-    recalls = np.array(recalls)
-    subjects = np.array(subjects)
-    # Get a list of unique subjects -- we will calculate a CRP for each
-    usub = np.unique(subjects)
-    # Number of possible lags = (listLength - 1) * 2 + 1; e.g. a length-24 list can have lags -23 through +23
-    num_lags = 2 * listLength - 1
-    # Initialize array to store the CRP for each subject (or other unique identifier)
-    result = np.zeros((usub.size, num_lags))
-    # Initialize arrays to store transition counts
-    actual = np.empty(num_lags)
-    poss = np.empty(num_lags)
-
-    # For each subject/unique identifier
-    for i, subj in enumerate(usub):
-        # Reset counts for each participant
-        actual.fill(0)
-        poss.fill(0)
-        # Create trials x items matrix where item j, k indicates whether the kth recall on trial j was a correct recall
-        clean_recalls_mask = np.array(make_clean_recalls_mask2d(recalls[subjects == subj]))
-        # For each trial that matches that identifier
-        for j, trial_recs in enumerate(recalls[subjects == subj]):
-            seen = set()
-            for k, rec in enumerate(trial_recs[:-1]):
-                seen.add(rec)
-                # Only increment transition counts if the current and next recall are BOTH correct recalls
-                if clean_recalls_mask[j][k] and clean_recalls_mask[j][k + 1] and k >= skip_first_n:
-                    next_rec = trial_recs[k + 1]
-                    pt = np.array([trans for trans in range(1 - rec, listLength + 1 - rec) if rec + trans not in seen], dtype=int)
-                    poss[pt + listLength - 1] += 1
-                    trans = next_rec - rec
-                    # Record the actual transition that was made
-                    actual[trans + listLength - 1] += 1
-
-        result[i, :] = [a/p if p!=0 else np.nan for a,p in zip(actual, poss)]
+    # Group the trials by subject -- we will calculate a CRP for each -- giving the row of the result for each trial
+    groups = group_by(subjects)
+    usub, subj_idx = groups.labels, groups.index
 
+    # Count the actual and possible transitions at each lag for every subject, enumerating every valid transition in
+    # each chunk of the recalls matrix (unless this has been done already)
+    actual = np.zeros((usub.size, 2 * listLength - 1))
+    poss = np.zeros((usub.size, 2 * listLength - 1))
+    for rows, chunk in transition_chunks(len(subjects), transitions, chunk_size, recalls, listLength):
+        chunk_actual, chunk_poss = lag_counts(chunk, subj_idx[rows], usub.size, skip_first_n)
+        actual += chunk_actual
+        poss += chunk_poss
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = actual / poss
+    result[poss == 0] = np.nan
     result[:, listLength - 1] = np.nan
 
     return result[:, listLength - lag_num - 1:listLength + lag_num]
+
+
+def lag_counts(transitions, subj_idx, n_subj, skip_first_n=0):
+    """
+    Helper function to count the actual and possible transitions at each lag, for each subject.
+
+    :param transitions: A TransitionTable built from the recalls matrix.
+    :param subj_idx: An array indicating the row of the output (0 to n_subj - 1) to which each trial's counts belong.
+    :param n_subj: The number of rows in the output.
+    :param skip_first_n: The number of transitions at the start of each trial to leave out of the counts. These recalls
+        still count as already recalled when determining which transitions were possible.
+
+    :return: Two n_subj x (2 * listLength - 1) arrays containing the number of actual and possible transitions at each
+        lag from -(listLength - 1) to +(listLength - 1).
+    """
+    listLength = transitions.listLength
+    num_lags = 2 * listLength - 1
+    keep = transitions.after(skip_first_n)
+    subj = subj_idx[transitions.trial[keep]]
+    from_pos = transitions.from_pos[keep]
+
+    # Record the actual transitions that were made
+    lags = transitions.lag[keep] + listLength - 1
+    actual = np.bincount(subj * num_lags + lags, minlength=n_subj * num_lags).reshape(n_subj, num_lags).astype(float)
+
+    # Sum the not-yet-recalled items over all transitions made from the same serial position, then shift each serial
+    # position's sums so that they line up by lag
+    from_key = subj * listLength + from_pos - 1
+    available = transitions.available[keep]
+    poss_by_from = np.empty((n_subj, listLength, listLength))
+    for pos_ind in range(listLength):
+        poss_by_from[:, :, pos_ind] = np.bincount(from_key[available[:, pos_ind]],
+                                                  minlength=n_subj * listLength).reshape(n_subj, listLength)
+    poss = np.zeros((n_subj, num_lags))
+    for from_ind in range(listLength):
+        poss[:, listLength - 1 - from_ind:2 * listLength - 1 - from_ind] += poss_by_from[:, from_ind]
+
+    return actual, poss
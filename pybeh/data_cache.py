@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import zipfile
+import numpy as np
+from scipy.io import loadmat
+from .FRdata import FRdata
+from .create_data import create_data, concatenate_sessions
+
+MANIFEST_NAME = 'manifest.json'
+BUNDLE_NAME = 'data.npz'
+
+
+def load_data(files=None, cache_dir=None, trial_field=None, loader=None, n_jobs=None):
+    """
+    Loads the data structure of create_data for a set of events files, caching the converted data on disk.
+
+    Each events file is converted once, and its data fields are saved to an npz file in cache_dir. A manifest in the same
+    directory records the modification time and size of every source file. On later calls, only the files that were
+    added or changed since they were cached are loaded and converted again. The combined data for the last set of files
+    is also saved as a single bundle, so that loading an unchanged set of files only reads that bundle. Cached files are
+    read without unpickling, and one that cannot be read that way (e.g. it holds object arrays) is converted again.
+
+    INPUTS:
+        files:          a list of paths to events files (e.g. one MATLAB events file per subject).
+        cache_dir:      the directory in which to store the cached data. It is created if it does not exist.
+        trial_field:    field within the events structure specifying which trial an event belongs to (see
+                        create_data). Changing it invalidates the whole cache.
+        loader:         (optional) a function that takes a path and returns an events record array that can be passed to
+                        create_data. By default, files are read with scipy.io.loadmat and converted with FRdata.
+        n_jobs:         number of worker processes used by create_data when converting a file (see create_data).
+
+    OUTPUTS:
+        data:           the data structure described in create_data, with the sessions of each file stacked in the
+                        order of files.
+    """
+    if files is None:
+        raise Exception('You must pass a list of events files.')
+    if cache_dir is None:
+        raise Exception('You must pass a cache directory.')
+    if loader is None:
+        loader = load_events
+    if trial_field is None:
+        trial_field = 'trial'
+
+    files = [os.path.abspath(path) for path in files]
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    manifest = _read_manifest(cache_dir)
+    if manifest.get('trial_field') != trial_field:
+        manifest = {'trial_field': trial_field, 'files': {}, 'bundle': None}
+
+    stale = [path for path in files if manifest['files'].get(path) != _source_info(path)]
+    bundle_path = os.path.join(cache_dir, BUNDLE_NAME)
+    if not stale and manifest['bundle'] == files and os.path.exists(bundle_path):
+        data = _load(bundle_path)
+        if data is not None:
+            return data
+
+    # Convert the files that changed, then reload the cached data of every other file
+    file_data = []
+    for path in files:
+        cache_path = os.path.join(cache_dir, _cache_name(path))
+        fields = None if path in stale or not os.path.exists(cache_path) else _load(cache_path)
+        if fields is None:
+            info = _source_info(path)
+            fields = create_data(loader(path), trial_field=trial_field, n_jobs=n_jobs)
+            _save(cache_path, fields)
+            manifest['files'][path] = info
+        file_data.append(fields)
+
+    file_data = [fields for fields in file_data if fields]
+    if len(files) == 1:
+        # The cached data of a single file already is its bundle, so it is not saved twice
+        data = file_data[0] if file_data else dict()
+        manifest['bundle'] = None
+    else:
+        data = concatenate_sessions(file_data)
+        _save(bundle_path, data)
+        manifest['bundle'] = files
+    _write_manifest(cache_dir, manifest)
+
+    return data
+
+
+def load_events(path):
+    """Loads a MATLAB events file as a record array that can be passed to create_data."""
+    return FRdata(loadmat(path, squeeze_me=True), as_recarray=True)
+
+
+def _source_info(path):
+    """Returns the modification time and size of a source file, which identify the version that was cached."""
+    stat = os.stat(path)
+    return {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def _cache_name(path):
+    """Returns the name of the npz file holding the cached data of a source file."""
+    return hashlib.sha1(path.encode('utf-8')).hexdigest() + '.npz'
+
+
+def _read_manifest(cache_dir):
+    path = os.path.join(cache_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(cache_dir, manifest):
+    path = os.path.join(cache_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def _save(path, data):
+    """Saves a data structure to an npz file. The file is replaced in one step, so readers never see a partial file."""
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, **data)
+    os.replace(path + '.tmp', path)
+
+
+def _load(path):
+    """
+    Loads a data structure saved by _save, restoring scalar fields (e.g. listLength) as Python scalars. Cached files are
+    read without unpickling, so a file holding object arrays (or one that cannot be read) returns None, and is rebuilt
+    by load_data like any other missing cache.
+    """
+    try:
+        with np.load(path, allow_pickle=False) as npz:
+            return {key: npz[key].item() if npz[key].ndim == 0 else npz[key] for key in npz.files}
+    except (ValueError, OSError, zipfile.BadZipFile):
+        return None
@@ -0,0 +1,152 @@
+import json
+import os
+from collections import OrderedDict
+import numpy as np
+from .ragged import RaggedArray
+
+INDEX_NAME = 'index.json'
+
+
+def save_data(data=None, path=None, subject_field='subjid'):
+    """
+    Saves the output of create_data as a directory of .npy files that can be memory-mapped by open_data.
+
+    Every array field is saved to its own .npy file, with its rows grouped by subject. RaggedArray fields (e.g. from
+    create_data with ragged=True) are saved as two files, key.values.npy and key.offsets.npy. An index recording the rows
+    of each subject, and the scalar fields (e.g. listLength), is saved alongside them as index.json. The index is written
+    last, so a directory without an index is an incomplete dataset.
+
+    INPUTS:
+        data:           the data structure described in create_data.
+        path:           the directory in which to store the dataset. It is created if it does not exist.
+        subject_field:  the field identifying the subject of each row. If the field is a matrix, its first column is
+                        used. (Default == 'subjid')
+    """
+    if data is None:
+        raise Exception('You must pass a data structure.')
+    if path is None:
+        raise Exception('You must pass a path.')
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    ragged = [key for key in data if isinstance(data[key], RaggedArray)]
+    fields = [key for key in data if key not in ragged and np.ndim(data[key]) > 0]
+    scalars = {key: _to_json(data[key]) for key in data if key not in ragged and np.ndim(data[key]) == 0}
+
+    # Group the rows of each subject together, keeping their order within each subject
+    subject_ids = _subject_ids(data[subject_field])
+    order = np.argsort(subject_ids, kind='stable')
+    subject_ids = subject_ids[order]
+    usub, starts = np.unique(subject_ids, return_index=True)
+    stops = np.append(starts[1:], len(subject_ids))
+    if np.array_equal(order, np.arange(len(order))):
+        order = slice(None)
+
+    for key in fields:
+        np.save(os.path.join(path, key + '.npy'), np.asarray(data[key])[order], allow_pickle=True)
+    for key in ragged:
+        field = data[key] if isinstance(order, slice) else data[key][order]
+        np.save(os.path.join(path, key + '.values.npy'), field.values, allow_pickle=True)
+        np.save(os.path.join(path, key + '.offsets.npy'), field.offsets)
+
+    index = {'subject_field': subject_field, 'fields': fields, 'ragged': ragged, 'scalars': scalars,
+             'subjects': [[_to_json(subj), int(start), int(stop)] for subj, start, stop in zip(usub, starts, stops)]}
+    with open(os.path.join(path, INDEX_NAME + '.tmp'), 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(os.path.join(path, INDEX_NAME + '.tmp'), os.path.join(path, INDEX_NAME))
+
+
+def open_data(path=None, subjects=None, mmap_mode='r'):
+    """
+    Opens a dataset saved by save_data, memory-mapping its arrays instead of reading them.
+
+    Opening a dataset only reads its index and the headers of its .npy files. The pages of an array are read from disk
+    when they are first accessed, so selecting a subset of subjects (either here, or by slicing the arrays with the row
+    ranges from subject_rows) only reads the rows of those subjects. The arrays can be passed directly to any pybeh
+    analysis.
+
+    INPUTS:
+        path:       the directory of the dataset.
+        subjects:   (optional) a list of subjects (as stored in the subject field) to open. Each subject's rows are
+                    contiguous on disk, so a single subject is returned as memory-mapped views. Several subjects are
+                    copied into memory from only their own rows. By default, every subject is opened.
+        mmap_mode:  the mode used to memory-map the arrays (see numpy.load). If None, the arrays are read into memory.
+                    (Default == 'r')
+
+    OUTPUTS:
+        data:       the data structure described in create_data, with memory-mapped arrays. RaggedArray fields are
+                    rebuilt as RaggedArrays, with memory-mapped values.
+    """
+    index = _read_index(path)
+    ragged = index.get('ragged', [])
+    data = dict()
+    for key in index['fields']:
+        data[key] = _load(os.path.join(path, key + '.npy'), mmap_mode)
+    for key in ragged:
+        data[key] = RaggedArray(_load(os.path.join(path, key + '.values.npy'), mmap_mode),
+                                np.load(os.path.join(path, key + '.offsets.npy')))
+
+    if subjects is not None:
+        rows = subject_rows(path)
+        missing = [subj for subj in subjects if subj not in rows]
+        if missing:
+            raise Exception('Subjects not found in dataset: ' + ', '.join(str(subj) for subj in missing))
+        ranges = [rows[subj] for subj in subjects]
+        for key in index['fields'] + ragged:
+            parts = [_rows(data[key], start, stop) for start, stop in ranges]
+            if len(parts) == 1:
+                data[key] = parts[0]
+            elif key in ragged:
+                data[key] = RaggedArray.concatenate(parts)
+            else:
+                data[key] = np.concatenate(parts)
+
+    data.update(index['scalars'])
+    return data
+
+
+def subject_rows(path=None):
+    """
+    Returns an ordered dictionary mapping each subject in a dataset saved by save_data to the (start, stop) range of its
+    rows, without opening any arrays.
+    """
+    return OrderedDict((subj, (start, stop)) for subj, start, stop in _read_index(path)['subjects'])
+
+
+def _load(path, mmap_mode):
+    try:
+        return np.load(path, mmap_mode=mmap_mode)
+    except ValueError:
+        # Object arrays (e.g. fields mixing text and numbers) cannot be memory-mapped
+        return np.load(path, allow_pickle=True)
+
+
+def _rows(field, start, stop):
+    """Returns rows start to stop of an array or RaggedArray, as a view of its (memory-mapped) data."""
+    if isinstance(field, RaggedArray):
+        offsets = field.offsets[start:stop + 1]
+        return RaggedArray(field.values[offsets[0]:offsets[-1]], offsets - offsets[0])
+    return field[start:stop]
+
+
+def _read_index(path):
+    if path is None:
+        raise Exception('You must pass a path.')
+    index_path = os.path.join(path, INDEX_NAME)
+    if not os.path.exists(index_path):
+        raise Exception('No dataset index found in ' + str(path))
+    with open(index_path) as f:
+        return json.load(f)
+
+
+def _subject_ids(field):
+    """Returns the subject of each row, taking the first column of a matrix field."""
+    field = np.asarray(field)
+    return field.reshape(len(field), -1)[:, 0] if field.ndim > 1 else field
+
+
+def _to_json(value):
+    """Converts a numpy scalar into a value that can be stored in the index."""
+    if isinstance(value, (np.generic, np.ndarray)):
+        value = value.item()
+    return value.decode() if isinstance(value, bytes) else value
@@ -0,0 +1,254 @@
+import functools
+import inspect
+import numpy as np
+from .chunks import as_matrix
+from .grouping import group_by, is_key_tuple
+from .mask_maker import make_clean_recalls_mask2d, make_tomask_from_frommask
+from .ragged import RaggedArray, first_occurrences
+from .result_cache import bound_arguments, cached_call, fingerprint
+from .transitions import TransitionTable
+
+# Analysis arguments that are filled from a RecallDataset, mapped to the dataset field (or derived field) they take
+DATASET_ARGUMENTS = {
+    'recalls': 'recalls',
+    'subjects': 'groups',
+    'subject': 'groups',
+    'listLength': 'listLength',
+    'list_length': 'listLength',
+    'times': 'times',
+    'time': 'times',
+    'rec_itemnos': 'rec_itemnos',
+    'recalls_itemnos': 'rec_itemnos',
+    'pres_itemnos': 'pres_itemnos',
+    'intrusions': 'intrusions',
+    'rec_items': 'rec_items',
+    'rec_mask': 'clean_mask',
+    'from_mask': 'clean_mask',
+    'to_mask': 'to_mask',
+    'transitions': 'transitions',
+    'first_items': 'first_items',
+}
+
+# Arguments that are not filled from a dataset if a chunk_size is given, since they hold intermediates computed over
+# every trial at once
+WHOLE_DATA_ARGUMENTS = ('transitions', 'first_items')
+
+
+class RecallDataset(object):
+    """
+    Wraps the data structure from create_data, and computes the fields that analyses derive from it on first access,
+    caching them so that running several analyses on the same dataset computes each of them once.
+
+    Fields of the data structure are read with dataset[key]. The derived fields are:
+
+        subjects:       the subject field as a 1D array, with one element per trial (or a tuple of such arrays, if
+                        grouping by several fields).
+        groups:         the trials grouped by subject (see grouping.Groups), whose labels are the unique subjects in the
+                        order of the rows of analysis results. Analyses are given these groups as their subjects, so
+                        the subjects are only factorized once.
+        listLength:     the listLength field, or the width of pres_itemnos if there is no such field.
+        recalls:        the recalls field, or make_recalls_matrix(pres_itemnos, rec_itemnos) if there is no such field.
+        intrusions:     the intrusions field, or create_intrusions.intrusions(...) if there is no such field.
+        clean_mask:     make_clean_recalls_mask2d(recalls), which is true for correct recalls that are not repetitions.
+        to_mask:        make_tomask_from_frommask(clean_mask).
+        transitions:    a TransitionTable of the recalls, with the times, rec_itemnos and pres_itemnos fields if present.
+        first_items:    a boolean matrix (or RaggedArray) with the shape of rec_items, which is true for the first recall
+                        of each word on its trial (see ragged.first_occurrences).
+
+    A derived field that cannot be computed because the fields it needs are missing raises a KeyError.
+
+    A dataset can be passed as the first argument of any analysis, in place of its data arguments (recalls, subjects,
+    listLength, times, rec_itemnos, pres_itemnos, intrusions, rec_items, and the masks, transitions and first_items of
+    the analyses that take them), e.g. crp(dataset, lag_num=5) or pli(dataset, exclude_reps=True). The other arguments must then be
+    passed by keyword. Arguments passed explicitly are not filled from the dataset.
+    """
+
+    def __init__(self, data=None, subject_field=None):
+        """
+        :param data: A data structure from create_data (or any dictionary of its fields).
+        :param subject_field: The field identifying the subject of each trial. If the field is a matrix, its first
+            column is used. A tuple of fields (e.g. ('subjid', 'session')) groups the trials by every combination of
+            their values, so that analyses return one row per combination. (DEFAULT = 'subjid' if the data has that
+            field, as data from create_data do, and 'subject' otherwise, e.g. for data from long_format.long_data)
+        """
+        if data is None:
+            raise Exception('You must pass a data structure.')
+        if subject_field is None:
+            # The subject field of create_data does not identify subjects uniquely, so the string ids are preferred
+            subject_field = 'subjid' if 'subjid' in data else 'subject'
+        self.data = data
+        self.subject_field = subject_field
+        self._cache = dict()
+
+    def __getitem__(self, key):
+        if key in self.data:
+            return self.data[key]
+        if key in _DERIVED:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.groups)
+
+    def keys(self):
+        return self.data.keys()
+
+    def clear_cache(self):
+        """Discards the derived fields, e.g. after changing the wrapped data structure."""
+        self._cache.clear()
+
+    def _cached(self, name, compute):
+        if name not in self._cache:
+            self._cache[name] = compute()
+        return self._cache[name]
+
+    @property
+    def subjects(self):
+        def vector(field):
+            subjects = np.asarray(self._field(field))
+            return subjects.reshape(len(subjects), -1)[:, 0] if subjects.ndim > 1 else subjects
+        if isinstance(self.subject_field, (tuple, list)):
+            return self._cached('subjects', lambda: tuple(vector(field) for field in self.subject_field))
+        return self._cached('subjects', lambda: vector(self.subject_field))
+
+    @property
+    def groups(self):
+        names = list(self.subject_field) if isinstance(self.subject_field, (tuple, list)) else None
+        return self._cached('groups', lambda: group_by(self.subjects, names=names))
+
+    @property
+    def listLength(self):
+        if 'listLength' in self.data:
+            return self.data['listLength']
+        return self._cached('listLength', lambda: np.shape(self._field('pres_itemnos'))[1])
+
+    @property
+    def recalls(self):
+        if 'recalls' in self.data:
+            return self.data['recalls']
+
+        def compute():
+            from .make_recalls_matrix import make_recalls_matrix
+            return make_recalls_matrix(self._field('pres_itemnos'), self._field('rec_itemnos'))
+        return self._cached('recalls', compute)
+
+    @property
+    def intrusions(self):
+        if 'intrusions' in self.data:
+            return self.data['intrusions']
+
+        def compute():
+            from .create_intrusions import intrusions
+            return intrusions(rec_itemnos=self._field('rec_itemnos'), pres_itemnos=self._field('pres_itemnos'),
+                              subjects=self._field('subject'), sessions=self._field('session'))
+        return self._cached('intrusions', compute)
+
+    @property
+    def clean_mask(self):
+        def compute():
+            recalls = self.recalls
+            if isinstance(recalls, RaggedArray):
+                mask = (recalls.values > 0) & first_occurrences(recalls)
+                return RaggedArray(mask.astype(recalls.dtype), recalls.offsets)
+            return make_clean_recalls_mask2d(recalls)
+        return self._cached('clean_mask', compute)
+
+    @property
+    def to_mask(self):
+        return self._cached('to_mask', lambda: make_tomask_from_frommask(self.clean_mask))
+
+    @property
+    def transitions(self):
+        return self._cached('transitions', lambda: TransitionTable(
+            self.recalls, self.listLength, times=self.data.get('times'), rec_itemnos=self.data.get('rec_itemnos'),
+            pres_itemnos=self.data.get('pres_itemnos')))
+
+    @property
+    def first_items(self):
+        def compute():
+            rec_items = as_matrix(self._field('rec_items'))
+            first = first_occurrences(rec_items)
+            if isinstance(rec_items, RaggedArray):
+                return RaggedArray(first, rec_items.offsets)
+            return first.reshape(len(rec_items), -1)
+        return self._cached('first_items', compute)
+
+    @property
+    def fingerprint(self):
+        """A hash of the wrapped data and the subject field, which identifies the dataset in the result cache."""
+        return self._cached('fingerprint', lambda: fingerprint({'data': dict(self.data),
+                                                                'subject_field': self.subject_field}))
+
+    def _field(self, key):
+        if key not in self.data:
+            raise KeyError(key)
+        return self.data[key]
+
+
+_DERIVED = ('subjects', 'groups', 'listLength', 'recalls', 'intrusions', 'clean_mask', 'to_mask', 'transitions',
+            'first_items')
+
+
+def accepts_dataset(func=None, skip=(), only_with=None):
+    """
+    Decorates an analysis so that a RecallDataset can be passed as its first argument. The arguments of the analysis
+    named in DATASET_ARGUMENTS are then filled from the dataset, unless they are passed explicitly, they are listed in
+    skip, or the dataset does not have the field. The arguments in WHOLE_DATA_ARGUMENTS are not filled if a chunk_size is
+    given, so that chunked analyses keep their bounded memory. Arguments listed in only_with (a dictionary mapping them to
+    the names of other arguments) are only filled if those other arguments are passed, for analyses that only use them
+    together (e.g. the times of p_stop_op, which are used with record_time and exit_time_thresh).
+
+    A tuple (or dictionary) of grouping keys passed as the subjects of the analysis is converted to a Groups object
+    (see grouping.group_by), so that the analysis returns one row per combination of keys.
+
+    If a result cache is enabled (see result_cache.enable_cache), results are loaded from it when the analysis was
+    already called with the same arguments, or on a dataset with the same fingerprint.
+
+    Can be used as @accepts_dataset, or as @accepts_dataset(skip=[...], only_with={...}).
+    """
+    if func is None:
+        return functools.partial(accepts_dataset, skip=skip, only_with=only_with)
+    only_with = only_with or {}
+    parameters = list(inspect.signature(func).parameters)
+    group_parameters = [(i, name) for i, name in enumerate(parameters) if DATASET_ARGUMENTS.get(name) == 'groups']
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not args or not isinstance(args[0], RecallDataset):
+            args = list(args)
+            for i, name in group_parameters:
+                if i < len(args) and _is_keys(args[i]):
+                    args[i] = group_by(args[i])
+                elif _is_keys(kwargs.get(name)):
+                    kwargs[name] = group_by(kwargs[name])
+            return cached_call(func, lambda: bound_arguments(func, args, kwargs), lambda: func(*args, **kwargs))
+        if len(args) > 1:
+            raise TypeError('When passing a RecallDataset, pass the other arguments of ' + func.__name__ +
+                            ' by keyword.')
+        dataset = args[0]
+
+        def compute():
+            filled = dict(kwargs)
+            for name in parameters:
+                if name in filled or name in skip or name not in DATASET_ARGUMENTS:
+                    continue
+                if name in WHOLE_DATA_ARGUMENTS and filled.get('chunk_size') is not None:
+                    continue
+                if any(filled.get(other) is None for other in only_with.get(name, ())):
+                    continue
+                try:
+                    filled[name] = dataset[DATASET_ARGUMENTS[name]]
+                except KeyError:
+                    pass
+            return func(**filled)
+        # A cached result is found from the fingerprint of the dataset, without computing the fields it would fill
+        return cached_call(func, lambda: dict(bound_arguments(func, kwargs=kwargs), dataset=dataset.fingerprint),
+                           compute)
+    return wrapper
+
+
+def _is_keys(value):
+    return isinstance(value, dict) or is_key_tuple(value)
@@ -1,10 +1,13 @@
 import warnings
 import numpy as np
-from pybeh.mask_maker import make_clean_recalls_mask2d
-from pybeh.make_recalls_matrix import make_recalls_matrix
+from pybeh.transitions import percentile_ranks, transition_chunks
+from pybeh.dataset import accepts_dataset
+from pybeh.grouping import group_by
 
 
-def dist_fact(rec_itemnos=None, pres_itemnos=None, subjects=None, dist_mat=None, is_similarity=False, skip_first_n=0):
+@accepts_dataset
+def dist_fact(rec_itemnos=None, pres_itemnos=None, subjects=None, dist_mat=None, is_similarity=False, skip_first_n=0,
+              transitions=None, chunk_size=None):
     """
     Returns a clustering factor score for each subject, based on the provided distance metric (Polyn, Norman, & Kahana,
     2009). Can also be used with a similarity matrix (e.g. LSA, word2vec) if is_similarity is set to True.
@@ -26,29 +29,34 @@ def dist_fact(rec_itemnos=None, pres_itemnos=None, subjects=None, dist_mat=None,
         as early transitions often differ from later transition in terms of their clustering. Note that the first n
         recalls will still count as already recalled words for the purposes of determining which transitions are
         possible. (DEFAULT = 0)
+    :param transitions: (Optional) A TransitionTable built with rec_itemnos and pres_itemnos (e.g. with
+        TransitionTable.from_itemnos). If given, rec_itemnos and pres_itemnos may be omitted and the transitions are not
+        enumerated again.
+    :param chunk_size: (Optional) If given, the rec_itemnos and pres_itemnos matrices are processed this many rows at a
+        time, which bounds peak memory for very large (e.g. memory-mapped) matrices. Ignored if transitions is given.
 
     :return: An array containing the clustering factor score for each subject (sorted by alphabetical order).
     """
 
-    if rec_itemnos is None:
-        raise Exception('You must pass a recall_itemnos matrix.')
-    if pres_itemnos is None:
-        raise Exception('You must pass a pres_itemnos matrix.')
+    if transitions is None:
+        if rec_itemnos is None:
+            raise Exception('You must pass a recall_itemnos matrix.')
+        if pres_itemnos is None:
+            raise Exception('You must pass a pres_itemnos matrix.')
+    elif transitions.from_itemno is None or transitions.pres_itemnos is None:
+        raise Exception('The transition table must be built with rec_itemnos and pres_itemnos.')
     if subjects is None:
         raise Exception('You must pass a subjects vector.')
     if dist_mat is None:
         raise Exception('You must pass either a similarity matrix or a distance matrix.')
-    if len(rec_itemnos) != len(subjects) or len(pres_itemnos) != len(subjects):
+    if transitions is None and (len(rec_itemnos) != len(subjects) or len(pres_itemnos) != len(subjects)):
         raise Exception('The rec_itemnos and pres_itemnos matrices must have the same number of rows as the list of'
                         'subjects.')
     if not isinstance(skip_first_n, int) or skip_first_n < 0:
         raise ValueError('skip_first_n must be a nonnegative integer.')
 
     # Convert inputs to numpy arrays if they are not arrays already
-    rec_itemnos = np.array(rec_itemnos)
-    pres_itemnos = np.array(pres_itemnos)
-    subjects = np.array(subjects)
-    dist_mat = np.array(dist_mat)
+    dist_mat = np.asarray(dist_mat)
 
     # Provide a warning if the user inputs a dist_mat that looks like a similarity matrix (scores on diagonal are
     # large), but has left is_similarity as False
@@ -57,34 +65,25 @@ def dist_fact(rec_itemnos=None, pres_itemnos=None, subjects=None, dist_mat=None,
                       ' matrix, but you currently have is_similarity set to False. If you are using a similarity'
                       ' matrix, make sure to set is_similarity to True when running dist_fact().')
 
-    # Initialize arrays to store each participant's results
-    usub = np.unique(subjects)
-    total = np.zeros_like(usub, dtype=float)
-    count = np.zeros_like(usub, dtype=float)
-
-    # Identify locations of all correct recalls (not PLI, ELI, or repetition)
-    clean_recalls_mask = np.array(make_clean_recalls_mask2d(make_recalls_matrix(pres_itemnos, rec_itemnos)))
-
-    # Calculate distance factor score for each trial
-    for i, trial_data in enumerate(rec_itemnos):
-        seen = set()
-        # Identify the current subject's index in usub to determine their position in the total and count arrays
-        subj_ind = np.where(usub == subjects[i])[0][0]
-        # Loop over the recalls on the current trial
-        for j, rec in enumerate(trial_data[:-1]):
-            seen.add(rec)
-            # Only count transition if both the current and next recalls are valid
-            if clean_recalls_mask[i, j] and clean_recalls_mask[i, j+1] and j >= skip_first_n:
-                # Identify the distance between the current recall and all valid recalls that could follow it
-                possibles = np.array([dist_mat[rec - 1, poss_rec - 1] for poss_rec in pres_itemnos[i] if poss_rec not in seen])
-                # Identify the distance between the current recall and the next
-                actual = dist_mat[rec - 1, trial_data[j + 1] - 1]
-                # Find the proportion of possible transitions that were larger than the actual transition
-                ptile_rank = dist_percentile_rank(actual, possibles, is_similarity)
-                # Add transition to the appropriate participant's score
-                if ptile_rank is not None:
-                    total[subj_ind] += ptile_rank
-                    count[subj_ind] += 1
+    # Initialize arrays to store each participant's results, and identify each trial's position in those arrays
+    groups = group_by(subjects)
+    usub, subj_idx = groups.labels, groups.index
+    total = np.zeros(usub.size)
+    count = np.zeros(usub.size)
+
+    # Identify all transitions between correct recalls (not PLI, ELI, or repetition) in each chunk of the itemno
+    # matrices, unless this has been done already
+    for rows, chunk in transition_chunks(len(subjects), transitions, chunk_size, rec_itemnos=rec_itemnos,
+                                         pres_itemnos=pres_itemnos):
+        # Calculate distance factor score for each transition, skipping the first n transitions of each trial
+        keep = chunk.after(skip_first_n)
+        ptile_ranks = dist_percentile_ranks(dist_mat, chunk.pres_itemnos, chunk.trial[keep], chunk.from_pos[keep],
+                                            chunk.to_pos[keep], chunk.available[keep], is_similarity)
+        # Add each transition to its participant's score, skipping those without a meaningful percentile rank
+        scored = ~np.isnan(ptile_ranks)
+        subj = subj_idx[rows][chunk.trial[keep][scored]]
+        total += np.bincount(subj, weights=ptile_ranks[scored], minlength=usub.size)
+        count += np.bincount(subj, minlength=usub.size)
 
     # Find temporal factor scores as the participants' average transition scores
     count[count == 0] = np.nan
@@ -102,8 +101,13 @@ def dist_percentile_rank(actual, possible, is_similarity=False):
     :is_similarity: If False, actual and possible values are assumed to be distances. If True, values are assumed to be
         similarity scores, where smaller values correspond to more distant transitions.
 
-    :return: The proportion of possible transitions that were more distant than the actual transition.
+    :return: The proportion of possible transitions that were more distant than the actual transition, or None if the
+        actual distance is NaN or fewer than 2 possible distances are defined.
     """
+    # Possible transitions with an undefined (NaN) distance cannot be ranked, so they are left out
+    possible = np.asarray(possible, dtype=float)
+    possible = possible[~np.isnan(possible)]
+
     # If there were fewer than 2 possible transitions, we can't compute a meaningful percentile rank
     if len(possible) < 2:
         return None
@@ -113,7 +117,7 @@ def dist_percentile_rank(actual, possible, is_similarity=False):
     possible = sorted(possible) if is_similarity else sorted(possible)[::-1]
 
     # Get indices of the one or more possible transitions with the same distance as the actual transition
-    matches = np.where(possible == actual)[0]
+    matches = np.where(np.asarray(possible) == actual)[0]
 
     if len(matches) > 0:
         # Get the number of possible transitions that were more distant than the actual transition
@@ -125,3 +129,79 @@ def dist_percentile_rank(actual, possible, is_similarity=False):
         ptile_rank = None
 
     return ptile_rank
+
+
+def dist_percentile_ranks(dist_mat, pres_itemnos, trial, from_pos, to_pos, available, is_similarity=False,
+                          max_block_size=2 ** 22):
+    """
+    Vectorized version of dist_percentile_rank, which scores many transitions at once.
+
+    The distances between all items presented on a trial are gathered from dist_mat in a single indexing operation, and
+    each row of that listLength x listLength submatrix is ranked once, from the most to the least distant item. Every
+    transition out of that trial is then scored by comparing the ranks of the items that were still available against
+    the rank of the item that was actually recalled next. Ties are handled exactly as in dist_percentile_rank.
+
+    Possible transitions whose distance is NaN (e.g. word pairs missing from dist_mat) are left out, and transitions
+    whose own distance is NaN get a NaN percentile rank.
+
+    :param dist_mat: An NxN matrix defining either the distance or similarity between every pair of words in the
+        wordpool.
+    :param pres_itemnos: A trials x items matrix containing the ID numbers (between 1 and N) of the items presented on
+        each trial.
+    :param trial: An array of the trials (rows of pres_itemnos) the transitions were made on, in ascending order.
+    :param from_pos: An array of the serial positions transitioned from.
+    :param to_pos: An array of the serial positions transitioned to.
+    :param available: A transitions x listLength boolean mask, which is True for serial positions that had not yet been
+        recalled when each transition was made.
+    :param is_similarity: If False, dist_mat is assumed to be a distance matrix. If True, dist_mat is instead treated as
+        a similarity matrix. (DEFAULT = False)
+    :param max_block_size: The maximum number of distances to gather at once. Trials are processed in blocks, so that
+        memory use stays bounded on large datasets.
+
+    :return: An array containing the proportion of possible transitions that were more distant than each actual
+        transition, or NaN where no meaningful percentile rank exists.
+    """
+    n_trans, listLength = available.shape
+    ptile_ranks = np.full(n_trans, np.nan)
+    if n_trans == 0:
+        return ptile_ranks
+    pres_idx = np.asarray(pres_itemnos)[:, :listLength].astype(int) - 1
+
+    trials, trial_ind = np.unique(trial, return_inverse=True)
+    trial_ind = trial_ind.ravel()
+    block_trials = max(1, max_block_size // (listLength * listLength))
+    for block_start in range(0, trials.size, block_trials):
+        # Select the transitions made on this block of trials (transitions are sorted by trial)
+        first, last = np.searchsorted(trial_ind, [block_start, block_start + block_trials])
+        local = trial_ind[first:last] - block_start
+        from_ind = from_pos[first:last] - 1
+        to_ind = to_pos[first:last] - 1
+
+        # Gather each trial's submatrix of distances between presented items, and rank each row
+        idx = pres_idx[trials[block_start:block_start + block_trials]]
+        sub = dist_mat[idx[:, :, None], idx[:, None, :]]
+        ranks = _dense_ranks(sub if is_similarity else -sub)
+
+        # Compare the ranks of the still-available items against the rank of the actual transition. Items whose
+        # distance is undefined (NaN) are not counted as possible transitions
+        row_ranks = ranks[local, from_ind]
+        actual_rank = row_ranks[np.arange(local.size), to_ind][:, None]
+        block_available = available[first:last] & ~np.isnan(sub[local, from_ind])
+        n_farther = np.sum(block_available & (row_ranks < actual_rank), axis=1)
+        n_equal = np.sum(block_available & (row_ranks == actual_rank), axis=1)
+        # A transition whose own distance is undefined cannot be matched to any possible transition
+        n_equal[np.isnan(sub[local, from_ind, to_ind])] = 0
+        ptile_ranks[first:last] = percentile_ranks(n_farther, n_equal, np.sum(block_available, axis=1))
+
+    return ptile_ranks
+
+
+def _dense_ranks(values):
+    """Ranks the values along the last axis from smallest to largest, giving tied values the same rank."""
+    order = np.argsort(values, axis=-1, kind='stable')
+    sorted_values = np.take_along_axis(values, order, axis=-1)
+    is_new = np.ones(values.shape, dtype=bool)
+    is_new[..., 1:] = sorted_values[..., 1:] != sorted_values[..., :-1]
+    ranks = np.empty(values.shape, dtype=int)
+    np.put_along_axis(ranks, order, np.cumsum(is_new, axis=-1), axis=-1)
+    return ranks
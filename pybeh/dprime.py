@@ -1,46 +1,35 @@
 from __future__ import division
 import numpy as np
 from scipy import stats
+from pybeh.FRdata import event_columns
 
 
 def dprime(events):
     """
     Input:
-        events: recog_events structure
+        events: recog_events structure, or a dictionary of its fields (e.g. from FRdata)
 
     Output:
         dprime: scalar drpime value
     """
-    hit = 0
-    miss = 0
-    false_alarm = 0
-    correct_rej = 0
-    target = 0
-    lure = 0
-    if len(events) < 1:
+    events = event_columns(events)
+    if not events or len(events['recog_conf']) < 1:
         raise Exception('events file is empty')
-    for num in range(len(events)):
-        if np.isnan(events[num].__dict__['recog_conf']) or (
-                    events[num].__dict__['recog_conf'] < 1) or (
-                    events[num].__dict__['recog_conf'] > 5):
-            continue
 
-        if events[num].__dict__['recog_conf'] == 'nan':
-            continue
-        if events[num].__dict__['recog_rt'] == 0:
-            continue
-        if events[num].__dict__['recog_resp'] == 1 and events[num].__dict__['type'] == 'RECOG_TARGET':
-            hit += 1
-            target += 1
-        elif events[num].__dict__['recog_resp'] == 0 and events[num].__dict__['type'] == 'RECOG_LURE':
-            correct_rej += 1
-            lure += 1
-        elif events[num].__dict__['recog_resp'] == 1 and events[num].__dict__['type'] == 'RECOG_LURE':
-            false_alarm += 1
-            lure += 1
-        elif events[num].__dict__['recog_resp'] == 0 and events[num].__dict__['type'] == 'RECOG_TARGET':
-            miss += 1
-            target += 1
+    # Only count responses with a valid confidence rating and a nonzero reaction time
+    conf = np.asarray(events['recog_conf'], dtype=float)
+    valid = (conf >= 1) & (conf <= 5) & (np.asarray(events['recog_rt']) != 0)
+    resp = np.asarray(events['recog_resp'])[valid]
+    types = np.asarray(events['type'])[valid]
+    is_target = types == 'RECOG_TARGET'
+    is_lure = types == 'RECOG_LURE'
+
+    hit = int(np.sum((resp == 1) & is_target))
+    miss = int(np.sum((resp == 0) & is_target))
+    false_alarm = int(np.sum((resp == 1) & is_lure))
+    correct_rej = int(np.sum((resp == 0) & is_lure))
+    target = hit + miss
+    lure = false_alarm + correct_rej
 
     hit /= float(target)
     miss /= float(target)
@@ -1,5 +1,4 @@
 import numpy as np
-from collections import Counter
 
 def events2data(events=None, index=None, index_rows=None, empty_val=None, ignore_fields=None):
 
@@ -16,35 +15,49 @@ def events2data(events=None, index=None, index_rows=None, empty_val=None, ignore
     if ignore_fields is None:
         ignore_fields = ['badEventChannel']
 
-    unique_index = np.unique(index)
+    index = np.asarray(index)
+    # get the position of each event's index value among the unique values
+    unique_index, index_inv, index_counts = np.unique(index, return_inverse=True, return_counts=True)
+    index_inv = index_inv.ravel()
 
     # set the order of rows in the final matrices
-    if not index_rows.any():
+    if index_rows is None or not np.any(index_rows):
         index_rows = unique_index
     elif set(unique_index) - set(index_rows):
         raise Exception('index_rows must include every value in index')
-
-    # get the row for each index in terms of all possible indices
-    rows = np.in1d(index_rows,unique_index)
+    index_rows = np.asarray(index_rows)
 
     # get the maximum row length
-    max_row_length = np.max([Counter(index).most_common(1)[0][1], Counter(index_rows).most_common(1)[0][1], 1])
+    _, index_rows_counts = np.unique(index_rows, return_counts=True)
+    max_row_length = np.max([np.max(index_counts, initial=0), np.max(index_rows_counts, initial=0), 1])
+
+    # get the column of each event: events with the same index fill a row in the order they occur
+    order = np.argsort(index_inv, kind='stable')
+    cols = np.empty(len(index), dtype=int)
+    cols[order] = np.arange(len(index)) - np.repeat(np.cumsum(index_counts) - index_counts, index_counts)
+
+    # get the row(s) of each event; an index value listed more than once in index_rows fills every matching row
+    rows_order = np.argsort(index_rows, kind='stable')
+    first_row = np.searchsorted(index_rows[rows_order], unique_index, side='left')
+    n_rows = np.searchsorted(index_rows[rows_order], unique_index, side='right') - first_row
+    n_dest = n_rows[index_inv]
+    event_inds = np.repeat(np.arange(len(index)), n_dest)
+    dest_offset = np.arange(len(event_inds)) - np.repeat(np.cumsum(n_dest) - n_dest, n_dest)
+    rows = rows_order[first_row[index_inv[event_inds]] + dest_offset]
+    cols = cols[event_inds]
 
     data = dict()
     # convert each field to matrix format and add to the data structure
-    for field in [fname for fname in events.dtype.names if not np.any([ignfields == fname for ignfields in ignore_fields])]:
-    # for field in events.dtype.names:
+    for field in [fname for fname in events.dtype.names if fname not in ignore_fields]:
 
         data[field] = np.empty([len(index_rows), max_row_length], dtype=events[field].dtype)
 
-        if events[field].dtype.type is not np.string_:
+        if events[field].dtype.type is not np.bytes_:
             data[field].fill(empty_val)
         else:
             data[field].fill('')
 
         # and finally fill in values according to index
-        for identifier in unique_index:
-            row_indices = index==identifier
-            data[field][index_rows==identifier,:sum(row_indices)] = events[field][row_indices]
+        data[field][rows, cols] = events[field][event_inds]
 
     return data
@@ -0,0 +1,180 @@
+import numpy as np
+from .chunks import row_chunks
+from .grouping import group_by
+
+
+def tidy(result=None, subjects=None, name='value', axis_name='position', axis_values=None):
+    """
+    Converts the output of an analysis into long-format (tidy) columns, with one row per subject and value.
+
+    Analyses return one row (or one element) per subject, sorted in the order of np.unique(subjects). This labels each
+    row with its subject: per-subject scalars (e.g. from reps, pli or temp_fact) become a subject column and a value
+    column, and per-subject curves (e.g. from spc, pnr or crp) become a subject column, a column giving the position of
+    each value on the curve, and a value column. The value column is a view of the result when it is a contiguous
+    array, so it is not copied. Results grouped by several keys (see grouping.Groups) get one column per key instead of
+    the subject column.
+
+    INPUTS:
+        result:         the output of an analysis, with one row (or element) per subject.
+        subjects:       the subjects vector, tuple of grouping keys or Groups that was passed to the analysis, or the
+                        unique subjects in sorted order.
+        name:           the name of the value column. (Default == 'value')
+        axis_name:      the name of the column giving the position of each value on a curve, e.g. 'serial_position'
+                        or 'lag'. Not used for per-subject scalars. (Default == 'position')
+        axis_values:    (optional) the position of each column of the result on the curve, e.g.
+                        np.arange(1, listLength + 1) for spc, or np.arange(-lag_num, lag_num + 1) for crp. By default,
+                        columns are numbered from 0.
+
+    OUTPUTS:
+        columns:        a dictionary of 1D arrays of equal length: 'subject' (or one column per grouping key), axis_name
+                        (for curves) and name.
+    """
+    if result is None:
+        raise Exception('You must pass an analysis result.')
+    if subjects is None:
+        raise Exception('You must pass a subjects vector.')
+    result = np.asarray(result)
+    groups = group_by(subjects)
+    usub = groups.labels
+    if len(result) != len(usub):
+        raise Exception('The result must have one row per unique subject.')
+    labels = {'subject': usub} if groups.names is None else {key: usub[key] for key in groups.names}
+
+    columns = dict()
+    if result.ndim == 1:
+        columns.update(labels)
+        columns[name] = result
+        return columns
+
+    values = result.reshape(len(usub), -1)
+    n_values = values.shape[1]
+    if axis_values is None:
+        axis_values = np.arange(n_values)
+    axis_values = np.asarray(axis_values)
+    if len(axis_values) != n_values:
+        raise Exception('axis_values must have one element per column of the result.')
+    for key, label in labels.items():
+        columns[key] = np.repeat(label, n_values)
+    columns[axis_name] = np.tile(axis_values, len(usub))
+    columns[name] = values.reshape(-1)
+    return columns
+
+
+class ResultWriter(object):
+    """
+    Streams analysis results to a Parquet or HDF5 file in long format, a few subjects at a time.
+
+    Each call to write appends the tidy columns (see tidy) of one batch of results, e.g. as each group of subjects
+    finishes, so the results of every subject never need to be held in memory at once. Every batch must have the same
+    columns. Parquet files get one row group per batch; HDF5 files store each column as a resizable dataset in a group.
+
+    Writing Parquet requires pyarrow, and writing HDF5 requires h5py.
+
+    Example:
+        with ResultWriter('spc.parquet') as writer:
+            for subj in np.unique(subjects):
+                is_subj = subjects == subj
+                writer.write(spc(recalls[is_subj], subjects[is_subj], listLength), subjects[is_subj],
+                             name='p_recall', axis_name='serial_position', axis_values=np.arange(1, listLength + 1))
+    """
+
+    def __init__(self, path=None, format=None, key='results'):
+        """
+        :param path: The file to write. An existing file is overwritten.
+        :param format: 'parquet' or 'hdf5'. By default, files ending in .h5, .hdf5 or .hdf are written as HDF5 and all
+            other paths as Parquet.
+        :param key: The name of the HDF5 group holding the columns. Not used for Parquet. (DEFAULT = 'results')
+        """
+        if path is None:
+            raise Exception('You must pass a path.')
+        if format is None:
+            format = 'hdf5' if str(path).lower().endswith(('.h5', '.hdf5', '.hdf')) else 'parquet'
+        if format not in ('parquet', 'hdf5'):
+            raise ValueError('format must be "parquet" or "hdf5".')
+        self.path = path
+        self.format = format
+        self.key = key
+        self.n_rows = 0
+        self._names = None
+        self._file = None
+
+    def write(self, result=None, subjects=None, name='value', axis_name='position', axis_values=None):
+        """
+        Appends the output of an analysis for a batch of subjects. The arguments are the same as for tidy.
+        """
+        self.write_columns(tidy(result, subjects, name=name, axis_name=axis_name, axis_values=axis_values))
+
+    def write_columns(self, columns):
+        """Appends a dictionary of 1D columns of equal length, e.g. from tidy."""
+        names = list(columns)
+        if self._names is None:
+            self._names = names
+        elif names != self._names:
+            raise Exception('Every batch must have the columns ' + ', '.join(self._names) + '.')
+        columns = {name: np.asarray(column) for name, column in columns.items()}
+        if self.format == 'parquet':
+            self._write_parquet(columns)
+        else:
+            self._write_hdf5(columns)
+        self.n_rows += len(columns[names[0]]) if names else 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write_parquet(self, columns):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('Writing Parquet requires pyarrow. Install it with "pip install pyarrow".')
+        table = pa.table({name: pa.array(column) for name, column in columns.items()})
+        if self._file is None:
+            self._file = pq.ParquetWriter(self.path, table.schema)
+        self._file.write_table(table.cast(self._file.schema))
+
+    def _write_hdf5(self, columns):
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError('Writing HDF5 requires h5py. Install it with "pip install h5py".')
+        if self._file is None:
+            self._file = h5py.File(self.path, 'w')
+            group = self._file.create_group(self.key)
+            for name, column in columns.items():
+                dtype = h5py.string_dtype() if column.dtype.kind in 'OSU' else column.dtype
+                group.create_dataset(name, shape=(0,), maxshape=(None,), dtype=dtype, chunks=True)
+        group = self._file[self.key]
+        for name, column in columns.items():
+            dataset = group[name]
+            start = dataset.shape[0]
+            dataset.resize((start + len(column),))
+            dataset[start:] = column.astype(object) if column.dtype.kind in 'SU' else column
+
+
+def export(path=None, result=None, subjects=None, name='value', axis_name='position', axis_values=None,
+           chunk_size=None, format=None):
+    """
+    Writes the output of an analysis to a Parquet or HDF5 file in long format (see tidy and ResultWriter).
+
+    :param chunk_size: (Optional) If given, the result is written this many subjects at a time.
+    Other parameters are described in tidy and ResultWriter.
+    """
+    if result is None:
+        raise Exception('You must pass an analysis result.')
+    if subjects is None:
+        raise Exception('You must pass a subjects vector.')
+    columns = tidy(result, subjects, name=name, axis_name=axis_name, axis_values=axis_values)
+    n_groups = len(result)
+    per_group = len(columns[name]) // n_groups if n_groups else 0
+    with ResultWriter(path, format=format) as writer:
+        for rows in row_chunks(n_groups, chunk_size):
+            writer.write_columns({key: column[rows.start * per_group:rows.stop * per_group]
+                                  for key, column in columns.items()})
@@ -0,0 +1,147 @@
+import numpy as np
+
+
+class Groups(object):
+    """
+    The rows of a dataset grouped by a key (e.g. subject), or by a combination of keys (e.g. subject, session and list
+    type), factorized once so that per-group reductions take a single pass over the rows instead of one boolean mask per
+    group.
+
+    Analyses return one row per group, in the order of labels (i.e. np.unique(keys), or the unique combinations of keys
+    sorted by the first key, then the second, and so on). A Groups object can be passed to any analysis in place of its
+    subjects vector, so that the keys are only factorized once across analyses. A tuple of key vectors can also be
+    passed in place of the subjects vector, to compute an analysis for every combination of keys in one pass.
+
+    ATTRIBUTES:
+        labels:     The unique keys, sorted. For several keys, a record array of the unique combinations, with one field
+                    per key.
+        names:      The names of the keys, or None for a single key.
+        index:      The group (position in labels) of each row.
+        n_groups:   The number of groups.
+        counts:     The number of rows in each group.
+    """
+
+    def __init__(self, keys=None, names=None):
+        """
+        :param keys: A 1D array with the group (e.g. subject) of each row. A column vector is also accepted. To group by
+            several keys, pass a tuple of such arrays, or a dictionary mapping key names to them.
+        :param names: (Optional) The names of the keys, when grouping by a tuple of keys. By default, keys are named
+            key0, key1, etc. (or by the dictionary keys).
+        """
+        if keys is None:
+            raise Exception('You must pass a vector of group keys.')
+        if isinstance(keys, dict):
+            names = list(keys) if names is None else names
+            keys = tuple(keys.values())
+        if is_key_tuple(keys):
+            self.labels, index = _unique_rows([_key_vector(key) for key in keys], names)
+            self.names = list(self.labels.dtype.names)
+        else:
+            self.labels, index = np.unique(_key_vector(keys), return_inverse=True)
+            self.names = None
+        self.index = index.ravel()
+        self.n_groups = len(self.labels)
+        self.counts = np.bincount(self.index, minlength=self.n_groups)
+        self._order = None
+
+    def __len__(self):
+        return self.index.size
+
+    @property
+    def order(self):
+        """
+        The rows sorted by group, keeping their original order within each group, or None if the rows of each group are
+        already contiguous and in label order.
+        """
+        if self._order is None:
+            if np.all(self.index[1:] >= self.index[:-1]):
+                self._order = slice(None)
+            else:
+                self._order = np.argsort(self.index, kind='stable')
+        return None if isinstance(self._order, slice) else self._order
+
+    @property
+    def offsets(self):
+        """The start of each group's segment in the rows sorted by group, followed by the number of rows."""
+        return np.append(0, np.cumsum(self.counts))
+
+    def segments(self):
+        """
+        Yields the position of each group in labels, and an array of the rows of that group (in their original order).
+        """
+        order = self.order
+        if order is None:
+            order = np.arange(len(self))
+        offsets = self.offsets
+        for group in range(self.n_groups):
+            yield group, order[offsets[group]:offsets[group + 1]]
+
+    def sum(self, values):
+        """
+        Sums values (with one row per row of the grouped data) within each group, keeping their dtype. Booleans are
+        counted.
+
+        :return: An array with one row per group.
+        """
+        values = np.asarray(values)
+        if values.dtype == bool:
+            values = values.astype(np.intp)
+        if len(values) != len(self):
+            raise Exception('values must have one row per row of the grouped data.')
+        if not len(values):
+            return np.zeros((self.n_groups,) + values.shape[1:], dtype=values.dtype)
+        order = self.order
+        return np.add.reduceat(values if order is None else values[order], self.offsets[:-1], axis=0)
+
+    def mean(self, values):
+        """Averages values (with one row per row of the grouped data) within each group."""
+        sums = self.sum(values)
+        return sums / self.counts.reshape((-1,) + (1,) * (sums.ndim - 1))
+
+
+def group_by(keys=None, names=None):
+    """
+    Returns keys as a Groups object, factorizing them unless they already are one.
+
+    :param keys: A vector with the group (e.g. subject) of each row, a tuple (or dictionary) of such vectors to group
+        by several keys, or a Groups object.
+    :param names: (Optional) The names of the keys, when grouping by a tuple of keys.
+    """
+    if isinstance(keys, Groups):
+        return keys
+    return Groups(keys, names=names)
+
+
+def is_key_tuple(keys):
+    """Returns True if keys is a tuple of key vectors (rather than a single vector given as a tuple of labels)."""
+    return isinstance(keys, tuple) and len(keys) > 0 and all(np.ndim(key) > 0 for key in keys)
+
+
+def _key_vector(key):
+    key = np.asarray(key)
+    return key.reshape(len(key), -1)[:, 0] if key.ndim > 1 else key
+
+
+def _unique_rows(keys, names=None):
+    """
+    Returns the unique combinations of several key vectors as a record array sorted by key, and the position of each
+    row's combination in it.
+    """
+    if names is None:
+        names = ['key' + str(i) for i in range(len(keys))]
+    if len(names) != len(keys):
+        raise Exception('You must pass one name per key.')
+    if any(len(key) != len(keys[0]) for key in keys):
+        raise Exception('All keys must have the same length.')
+    # Factorize each key, then combine the codes of each row into a single code that sorts in the same order
+    uniques, codes = zip(*[np.unique(key, return_inverse=True) for key in keys])
+    dims = [max(len(unique), 1) for unique in uniques]
+    codes = [code.ravel() for code in codes]
+    if np.prod(dims, dtype=float) < np.iinfo(np.int64).max:
+        combined, index = np.unique(np.ravel_multi_index(codes, dims), return_inverse=True)
+        group_codes = np.unravel_index(combined, dims)
+    else:
+        combined, index = np.unique(np.stack(codes, axis=1), axis=0, return_inverse=True)
+        group_codes = combined.T
+    labels = np.rec.fromarrays([unique[code] for unique, code in zip(uniques, group_codes)], names=list(names))
+    return labels, index.ravel()
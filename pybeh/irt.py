@@ -1,3 +1,7 @@
+import numpy as np
+from pybeh.dataset import accepts_dataset
+
+@accepts_dataset
 def irt(times=None):
     """
     IRT Inter-response time.
@@ -15,7 +19,14 @@ def irt(times=None):
         irts:   a matrix whose rows contain mean inter-response times
                 for each of the unique values in index
     """
-    irt = times[:]
+    if isinstance(times, np.ndarray):
+        irt = np.zeros_like(times)
+        if times.shape[1] > 1:
+            # Each recall's IRT is stored at the position of the recall before it, and is 0 after the last recall
+            irt[:, :-2] = np.where(times[:, 1:-1] == 0, 0, times[:, 1:-1] - times[:, :-2])
+            irt[:, -2] = times[:, -2]
+        return irt
+    irt = [list(item) for item in times]
     for num, item in enumerate(times):
         for index,recall in enumerate(item):
             if index == len(item) - 1:
@@ -0,0 +1,89 @@
+import numpy as np
+from .ragged import RaggedArray
+
+
+def long_data(subjects=None, trials=None, recalls=None, times=None, output_positions=None, sessions=None, **columns):
+    """
+    Builds the recall fields of create_data from long-format columns, with one row per recall, without pivoting them
+    into padded matrices.
+
+    The rows of each trial must be contiguous, as they are when events are read in order or from a table sorted by
+    trial. Each trial becomes a segment of a RaggedArray, delimited by the rows where the subject, session or trial
+    changes, so the columns are used as the values of the RaggedArrays without being copied. The recall fields can be
+    passed to any analysis that accepts RaggedArrays (e.g. spc, pfr, pnr, crp, crl and temp_fact), together with the
+    subject field, and give exactly the results of the corresponding padded matrices.
+
+    A trial on which nothing was recalled should be included as a single row whose serial position is 0, in the same
+    way that such a trial is padded with zeros in the recalls matrix. Trials that do not appear at all are not counted
+    by the analyses (e.g. in the denominator of spc).
+
+    INPUTS:
+        subjects:           the subject of each recall.
+        trials:             the trial (e.g. list number) of each recall.
+        recalls:            the serial position of each recall; -1 for intrusions, as in the recalls matrix.
+        times:              (optional) the time of each recall.
+        output_positions:   (optional) the output position of each recall. If given and the rows of a trial are not in
+                            output order, the rows are sorted by subject, session, trial and output position (copying
+                            the columns).
+        sessions:           (optional) the session of each recall, if trial numbers repeat across sessions.
+        columns:            (optional) any other columns with one element per recall (e.g. rec_itemnos or
+                            intrusions), which are returned as RaggedArrays.
+
+    OUTPUTS:
+        data:               a dictionary with 'subject' (and 'session', if given) holding one element per trial, and
+                            'recalls', 'times' and any other columns as RaggedArrays with one row per trial.
+    """
+    if subjects is None:
+        raise Exception('You must pass a subjects vector.')
+    if trials is None:
+        raise Exception('You must pass a trials vector.')
+    if recalls is None:
+        raise Exception('You must pass a recalls vector.')
+
+    subjects = np.asarray(subjects)
+    trials = np.asarray(trials)
+    keys = [subjects] + ([np.asarray(sessions)] if sessions is not None else []) + [trials]
+    fields = dict(columns, recalls=recalls)
+    if times is not None:
+        fields['times'] = times
+    fields = {key: np.asarray(field) for key, field in fields.items()}
+    if output_positions is not None:
+        output_positions = np.asarray(output_positions)
+    for name, column in [('output_positions', output_positions)] + list(fields.items()):
+        if column is not None and len(column) != len(trials):
+            raise Exception(name + ' must have one element per recall.')
+
+    offsets = trial_offsets(*keys)
+    if output_positions is not None:
+        # Outputs must increase within each trial; otherwise, sort the rows of each trial into output order
+        out_of_order = np.diff(output_positions) <= 0
+        out_of_order[offsets[1:-1] - 1] = False
+        if np.any(out_of_order):
+            order = np.lexsort((output_positions,) + tuple(reversed(keys)))
+            keys = [key[order] for key in keys]
+            fields = {key: field[order] for key, field in fields.items()}
+            offsets = trial_offsets(*keys)
+
+    data = dict()
+    data['subject'] = keys[0][offsets[:-1]]
+    if sessions is not None:
+        data['session'] = keys[1][offsets[:-1]]
+    for key, field in fields.items():
+        data[key] = RaggedArray(field, offsets)
+    return data
+
+
+def trial_offsets(*keys):
+    """
+    Returns the offsets (see RaggedArray) of the runs of consecutive rows on which all of the given key columns (e.g.
+    subject and trial) are equal.
+    """
+    n_rows = len(keys[0]) if keys else 0
+    new_trial = np.zeros(n_rows, dtype=bool)
+    new_trial[:1] = True
+    for key in keys:
+        key = np.asarray(key)
+        if len(key) != n_rows:
+            raise Exception('All key columns must have the same length.')
+        new_trial[1:] |= key[1:] != key[:-1]
+    return np.append(np.flatnonzero(new_trial), n_rows)
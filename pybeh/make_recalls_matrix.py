@@ -1,5 +1,5 @@
 import numpy as np
-import pandas as pd
+from pybeh.ragged import RaggedArray, flatten
 
 
 def get_itemno_matrices(evs, itemno_column='itemno', list_index=['subject', 'session', 'list'], fill_value=np.nan):
@@ -7,14 +7,16 @@ def get_itemno_matrices(evs, itemno_column='itemno', list_index=['subject', 'ses
     Transforms a pandas dataframe into a matrix of item id's with one row per trial, 
     as is expected by most behavioral toolbox functions.
     
-    Expects as input a dataframe (df) for one subject
+    Expects as input a dataframe (df) for one subject. The dataframe is not modified.
     
     INPUTS:
     evs:            The dataframe from which to extract itemnos. By default, each 
                     distinct set of values in the (subject, session, list) columns
                     denotes a different trial.
                     
-    itemno_column:  The column of the dataframe where items are annotated with item numbers
+    itemno_column:  The column of the dataframe where items are annotated with item numbers,
+                    or a list of columns (e.g. ['itemno', 'rectime', 'item']) to extract
+                    at once
     
     list_index:     Columns passed to pd.groupby that uniquely identify each trial
     
@@ -23,18 +25,37 @@ def get_itemno_matrices(evs, itemno_column='itemno', list_index=['subject', 'ses
     OUTPUTS:
     A matrix of item numbers with shape (trials, max_length), where trials is determined by the
     number of combinations of list_index coordinates in the data and max_length is determined
-    by the trial with the greatest number of items.
+    by the trial with the greatest number of items. Rows are sorted by the list_index columns,
+    and events keep their order within each trial. Numeric columns give float matrices, and
+    other columns (e.g. item names) give object matrices.
+    
+    If itemno_column is a list, returns a dictionary mapping each column to its matrix instead.
+    All of the matrices share the same rows and columns.
     """
-    evs.loc[:, itemno_column] = evs.loc[:, itemno_column].astype(int)
-    evs['pos'] = evs.groupby(list_index).cumcount()
-    itemnos_df = pd.pivot_table(evs, values=itemno_column, 
-                                 index=list_index, 
-                                 columns='pos', fill_value=fill_value)
-    itemnos = itemnos_df.values
-    return itemnos
-
-
-def make_recalls_matrix(pres_itemnos=None, rec_itemnos=None):
+    # Number the trials in sorted order, and each event's position within its trial
+    grouped = evs.groupby(list_index, sort=True)
+    trial = grouped.ngroup().to_numpy(dtype=float, na_value=np.nan)
+    pos = grouped.cumcount().to_numpy(dtype=float, na_value=np.nan)
+    # Events with a missing value in any of the list_index columns do not belong to a trial
+    keep = trial >= 0
+    trial = trial[keep].astype(int)
+    pos = pos[keep].astype(int)
+    shape = (grouped.ngroups, pos.max() + 1 if pos.size else 0)
+
+    columns = [itemno_column] if isinstance(itemno_column, str) else list(itemno_column)
+    matrices = dict()
+    for column in columns:
+        values = evs[column].to_numpy()[keep]
+        dtype = np.result_type(values.dtype, np.float64) if values.dtype.kind in 'biuf' else object
+        matrices[column] = np.full(shape, fill_value, dtype=dtype)
+        matrices[column][trial, pos] = values
+
+    if isinstance(itemno_column, str):
+        return matrices[itemno_column]
+    return matrices
+
+
+def make_recalls_matrix(pres_itemnos=None, rec_itemnos=None, dtype=int):
     '''
 
     MAKE_RECALLS_MATRIX   Make a standard recalls matrix.
@@ -53,10 +74,14 @@ def make_recalls_matrix(pres_itemnos=None, rec_itemnos=None):
                   items. Must match pres_itemnos. Items not in the
                   stimulus pool (extra-list intrusions) should be
                   labeled with -1. Rows may be padded with zeros or
-                  NaNs.
+                  NaNs. May also be a RaggedArray.
+
+    dtype:        integer dtype of the output (e.g. np.int8 when lists
+                  have no more than 127 items). Default is int.
 
     OUTPUTS:
-    recalls:  [trials X recalls] matrix. For recall(i,j), possible
+    recalls:  [trials X recalls] matrix (a RaggedArray with the same
+             rows if rec_itemnos is one). For recall(i,j), possible
              values are:
              >0   correct recall. Indicates the serial position in
                   which the recalled item was presented.
@@ -65,34 +90,55 @@ def make_recalls_matrix(pres_itemnos=None, rec_itemnos=None):
 
     :param pres_itemnos:
     :param rec_itemnos:
+    :param dtype:
     :return:
     '''
 
-    n_trials = np.shape(pres_itemnos)[0]
-    n_items = np.shape(pres_itemnos)[1]
-
-    n_recalls = np.shape(rec_itemnos)[1]
-
-    recalls = np.empty([n_trials,n_recalls], dtype=int)
-    recalls.fill(0)
-
-    for trial in np.arange(n_trials):
-        for recall in np.arange(n_recalls):
-
-            if (rec_itemnos[trial,recall]) == 0 | (np.isnan(rec_itemnos[trial, recall])):
-                continue
-
-            elif rec_itemnos[trial,recall] > 0:
-
-                serialpos = np.where(rec_itemnos[trial,recall] == pres_itemnos[trial,:])[0]+1
-
-                if len(serialpos) > 1:
-                    raise Exception('An item was presented more than once.')
-                elif not any(serialpos):
-                    recalls[trial, recall] = -1
-                else:
-                    recalls[trial, recall] = serialpos
-            else:
-                recalls[trial, recall] = -1
-
-    return recalls
+    pres_itemnos = np.asarray(pres_itemnos)
+    ragged = isinstance(rec_itemnos, RaggedArray)
+    if not ragged:
+        rec_itemnos = np.asarray(rec_itemnos)
+    # Work on the recalled items as a flat array, so that padded and ragged matrices are handled the same way
+    rec_values, rec_rows, _ = flatten(rec_itemnos)
+
+    recalls = np.zeros(rec_values.size, dtype=dtype)
+
+    # Number the distinct presented items, so that each (trial, item) pair has a unique integer key. Zeros and NaNs in
+    # pres_itemnos are padding and are never matched.
+    presented = pres_itemnos > 0
+    items = np.unique(pres_itemnos[presented])
+    pres_trial, pres_col = np.nonzero(presented)
+    pres_keys = pres_trial * items.size + np.searchsorted(items, pres_itemnos[presented])
+
+    # Sort the keys, giving an index of each trial's presented items in order of item number
+    order = np.argsort(pres_keys, kind='stable')
+    pres_keys = pres_keys[order]
+    pres_col = pres_col[order]
+
+    # Look up every recalled item in the index of its own trial
+    rec_ind = np.flatnonzero(rec_values > 0)
+    rec_trial = rec_rows[rec_ind]
+    rec_vals = rec_values[rec_ind]
+    item_ind = np.searchsorted(items, rec_vals)
+    in_pool = item_ind < items.size
+    in_pool[in_pool] = items[item_ind[in_pool]] == rec_vals[in_pool]
+    rec_keys = rec_trial * items.size + item_ind
+    first = np.searchsorted(pres_keys, rec_keys, side='left')
+    n_matches = np.where(in_pool, np.searchsorted(pres_keys, rec_keys, side='right') - first, 0)
+
+    if np.any(n_matches > 1):
+        raise Exception('An item was presented more than once.')
+    if pres_itemnos.ndim == 2 and pres_itemnos.shape[1] > np.iinfo(dtype).max:
+        raise ValueError('dtype is too small to hold the serial positions of the presented lists.')
+
+    # Items that were not presented on the trial, and negative item numbers, are intrusions. Zeros and NaNs in
+    # rec_itemnos are padding.
+    recalls[rec_values < 0] = -1
+    serialpos = np.full(rec_vals.size, -1)
+    matched = n_matches == 1
+    serialpos[matched] = pres_col[first[matched]] + 1
+    recalls[rec_ind] = serialpos
+
+    if ragged:
+        return RaggedArray(recalls, rec_itemnos.offsets)
+    return recalls.reshape(np.shape(rec_itemnos))
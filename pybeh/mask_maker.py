@@ -1,8 +1,12 @@
 import copy
 import numpy as np
+from pybeh.ragged import first_occurrences
 
 def make_clean_recalls_mask2d(data):
     """makes a clean mask without repetition and intrusion"""
+    if isinstance(data, np.ndarray):
+        mask = (data > 0) & first_occurrences(data).reshape(data.shape)
+        return mask.astype(data.dtype)
     result = copy.deepcopy(data)
     for num, item in enumerate(data):
         seen = []
@@ -18,6 +22,8 @@ def make_clean_recalls_mask2d(data):
 
 def make_mask_only_pli2d(data):
     """makes a mask with only pli as True aka 1, and 0 everywhere else"""
+    if isinstance(data, np.ndarray):
+        return ((data != 0) & (data != -1)).astype(data.dtype)
     result = copy.deepcopy(data)
     for num, item in enumerate(data):
         for index, recall in enumerate(item):
@@ -31,6 +37,8 @@ def make_mask_only_pli2d(data):
 
 def make_mask_only_xli2d(data):
     """makes a mask with only xli as True aka 1, and 0 everywhere else"""
+    if isinstance(data, np.ndarray):
+        return (data == -1).astype(data.dtype)
     result = copy.deepcopy(data)
     for num, item in enumerate(data):
         for index, recall in enumerate(item):
@@ -42,6 +50,10 @@ def make_mask_only_xli2d(data):
 
 def make_tomask_from_frommask(frommask):
     """makes a to_mask from from_mask"""
+    if isinstance(frommask, np.ndarray):
+        tomask = np.zeros_like(frommask)
+        tomask[:, :-1] = frommask[:, 1:]
+        return tomask
     tomask = []
     for num, list in enumerate(frommask):
         tomask.append(list[1:] + [0])
@@ -54,9 +66,11 @@ def make_blank_mask(data_matrix):
 
 def mask_data(data, mask):
     """id data is same shape as mask, returns values in data where mask is true"""
-    result = copy.deepcopy(data)
     if len(data) != len(mask):
         raise Exception('data and mask need to have same shape')
+    if isinstance(data, np.ndarray) and isinstance(mask, np.ndarray):
+        return np.where(mask == 0, 0, data).astype(data.dtype, copy=False)
+    result = copy.deepcopy(data)
     for index, item in enumerate(mask):
         for ind, num in enumerate(item):
             if num == 0:
@@ -65,6 +79,8 @@ def mask_data(data, mask):
 
 def mask_nan(data):
     """converts nan from data to 0"""
+    if isinstance(data, np.ndarray):
+        return (~np.isnan(data)).astype(data.dtype)
     result = copy.deepcopy(data)
     for index, item in enumerate(result):
         for ind, num in enumerate(item):
@@ -73,4 +89,3 @@ def mask_nan(data):
             else:
                 result[index][ind] = 1
     return result
-
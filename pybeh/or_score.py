@@ -1,7 +1,9 @@
 from __future__ import division
-import numpy as np
 import pybeh.mask_maker as mask
+from pybeh.dataset import accepts_dataset
+from pybeh.grouping import group_by
 
+@accepts_dataset(skip=['rec_mask'])
 def or_score(recalls=None, subjects = None, listLength = None, rec_mask= None):
     """
     OR_SCORE  Recall probability for either of a pair, conditional on their lag.
@@ -56,8 +58,8 @@ def or_score(recalls=None, subjects = None, listLength = None, rec_mask= None):
     elif len(rec_mask) != len(recalls):
         raise Exception('rec_mask needs to be same shape as recalls.')
     result = []
-    subject = np.unique(subjects)
-    for subj in subject:
+    groups = group_by(subjects)
+    for group, rows in groups.segments():
         orscore_subj = []
 
         for lag in range(1, listLength):
@@ -65,12 +67,11 @@ def or_score(recalls=None, subjects = None, listLength = None, rec_mask= None):
             track = [0] * (listLength - lag)
             n = 0
 
-            for subj_ind, subj_num in enumerate(subjects):
-                if subj == subj_num:
-                    n += 1
-                    for ind in range(len(track)):
-                        if ind+1 in recalls[subj_ind] or ind+1 + lag in recalls[subj_ind]:
-                            track[ind] += 1
+            for subj_ind in rows:
+                n += 1
+                for ind in range(len(track)):
+                    if ind+1 in recalls[subj_ind] or ind+1 + lag in recalls[subj_ind]:
+                        track[ind] += 1
             total = 0
             print(track)
             for val in track:
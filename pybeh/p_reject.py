@@ -1,7 +1,9 @@
 from __future__ import division
-import numpy as np
 import pybeh.mask_maker as mask
+from pybeh.dataset import accepts_dataset
+from pybeh.grouping import group_by
 
+@accepts_dataset
 def p_reject(rejects_matrix = None, subject = None, rec_mask = None, recalls = None):
     """
     P_REJECT Computes probability of rejecting recalled items.
@@ -41,22 +43,18 @@ def p_reject(rejects_matrix = None, subject = None, rec_mask = None, recalls = N
         rec_mask = mask.make_clean_recalls_mask2d(recalls)
     elif len(rejects_matrix) != len(subject):
         raise Exception('rejects matrix needs to be same length as subjects.')
-    subjects = np.unique(subject)
+    groups = group_by(subject)
     result = []
-    for subj in subjects:
-
-        for subj_ind, subj_num in enumerate(subject):
-            if subj == subj_num:
-                denom = 0
-                num = 0
-        for subj_ind, subj_num in enumerate(subject):
-            if subj == subj_num:
-                for index, item in enumerate(rec_mask[subj_ind]):
-                    if item == 1:
-                        denom += 1
-                        if rejects_matrix[subj_ind][index] == 1:
-                            num += 1
-        print(subj, denom, num)
+    for group, rows in groups.segments():
+        denom = 0
+        num = 0
+        for subj_ind in rows:
+            for index, item in enumerate(rec_mask[subj_ind]):
+                if item == 1:
+                    denom += 1
+                    if rejects_matrix[subj_ind][index] == 1:
+                        num += 1
+        print(groups.labels[group], denom, num)
         if denom != 0:
             result.append(num / float(denom))
         else:
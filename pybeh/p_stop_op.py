@@ -1,8 +1,10 @@
 from __future__ import division
-import numpy as np
 import pybeh.mask_maker as mask
+from pybeh.dataset import accepts_dataset
+from pybeh.grouping import group_by
 
 
+@accepts_dataset(only_with={'time': ['record_time', 'exit_time_thresh']})
 def p_stop_op(recalls = None, subject = None, time = None, record_time = None, exit_time_thresh = None, rec_mask = None):
     """
     P_STOP_OP  Probability of stopping recall by output position.
@@ -91,45 +93,44 @@ def p_stop_op(recalls = None, subject = None, time = None, record_time = None, e
 
     elif len(recalls) != len(subject):
         raise Exception('recalls matrix must have the same number of rows as subjects.')
-    if rec_mask == None:
+    if rec_mask is None:
         rec_mask = mask.make_clean_recalls_mask2d(recalls)
-    if any([time != None, record_time != None, exit_time_thresh != None]) and not all([time != None, record_time != None, exit_time_thresh != None]):
+    if any([time is not None, record_time is not None, exit_time_thresh is not None]) and not all([time is not None, record_time is not None, exit_time_thresh is not None]):
         raise Exception('You must pass a time_mat, recall_length scalar, and an exit_time_thresh scalar, or all must be empty.')
-    elif all([time != None, record_time != None, exit_time_thresh != None]):
+    elif all([time is not None, record_time is not None, exit_time_thresh is not None]):
         marker = True
         if len(time) != len(recalls):
             raise Exception('time matrix needs to be same shape as recalls')
     else:
         marker = False
     recalls = mask.mask_data(recalls, rec_mask)
-    subjects = np.unique(subject)
+    groups = group_by(subject)
     result = []
-    for subj in subjects:
+    for group, rows in groups.segments():
         stop = [0] * len(recalls[0])
         num = [0] * len(recalls[0])
-        for subj_ind, subj_num in enumerate(subject):
-            if subj == subj_num:
-                if marker == True:
-                    if last_nonzero(time[subj_ind]) == None:
-                        continue
-                    elif record_time - last_nonzero(time[subj_ind]) > exit_time_thresh and record_time - last_nonzero(time[subj_ind]) > max_irt(time[subj_ind]):
-                        for n, rec in enumerate(recalls[subj_ind]):
-                            if rec != 0:
-                                num[n] += 1
-                        for n, rec in enumerate(recalls[subj_ind][::-1]):
-                            if rec != 0:
-                                stop[len(recalls[0]) - n - 1] += 1
-                                break
-                    else:
-                        continue
-                else:
+        for subj_ind in rows:
+            if marker == True:
+                if last_nonzero(time[subj_ind]) is None:
+                    continue
+                elif record_time - last_nonzero(time[subj_ind]) > exit_time_thresh and record_time - last_nonzero(time[subj_ind]) > max_irt(time[subj_ind]):
                     for n, rec in enumerate(recalls[subj_ind]):
                         if rec != 0:
                             num[n] += 1
                     for n, rec in enumerate(recalls[subj_ind][::-1]):
                         if rec != 0:
-                            stop[len(recalls[0]) - n -1] += 1
+                            stop[len(recalls[0]) - n - 1] += 1
                             break
+                else:
+                    continue
+            else:
+                for n, rec in enumerate(recalls[subj_ind]):
+                    if rec != 0:
+                        num[n] += 1
+                for n, rec in enumerate(recalls[subj_ind][::-1]):
+                    if rec != 0:
+                        stop[len(recalls[0]) - n -1] += 1
+                        break
 
         for index in range(len(stop)):
             if stop[index] != 0:
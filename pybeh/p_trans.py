@@ -1,6 +1,8 @@
 from __future__ import division
-import numpy as np
+from pybeh.dataset import accepts_dataset
+from pybeh.grouping import group_by
 
+@accepts_dataset
 def p_trans(subject, from_mask, to_mask):
     """
     P_TRANS  Probability of transitioning between recall types.
@@ -123,16 +125,15 @@ def p_trans(subject, from_mask, to_mask):
     elif len(to_mask) != len(from_mask):
         raise Exception('to_mask needs to be same shape as from_mask.')
     result = []
-    subjects = np.unique(subject)
-    for subj in subjects:
+    groups = group_by(subject)
+    for group, rows in groups.segments():
         count = 0
         total = 0
-        for subj_ind, subj_num in enumerate(subject):
-            if subj == subj_num:
-                for index, item in enumerate(from_mask[subj_ind]):
-                    if item == 1:
-                        total += 1
-                        if to_mask[subj_ind][index] == 1:
-                            count += 1
+        for subj_ind in rows:
+            for index, item in enumerate(from_mask[subj_ind]):
+                if item == 1:
+                    total += 1
+                    if to_mask[subj_ind][index] == 1:
+                        count += 1
         result.append(count / float(total))
     return result
\ No newline at end of file
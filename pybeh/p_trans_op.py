@@ -1,6 +1,8 @@
 from __future__ import division
-import numpy as np
+from pybeh.dataset import accepts_dataset
+from pybeh.grouping import group_by
 
+@accepts_dataset
 def p_trans_op(subject, from_mask, to_mask):
     """
     P_TRANS_OP  Probability of transitioning recall types, by output position.
@@ -79,20 +81,17 @@ def p_trans_op(subject, from_mask, to_mask):
     elif len(to_mask) != len(from_mask):
         raise Exception('to_mask needs to be same shape as from_mask.')
     final = []
-    subjects = np.unique(subject)
-    for subj in subjects:
+    groups = group_by(subject)
+    for group, rows in groups.segments():
         result = []
-        for subj_ind, subj_num in enumerate(subject):
-            if subj == subj_num:
-                denom = [0] * len(from_mask[subj_ind])
-                num = [0] * len(from_mask[subj_ind])
-        for subj_ind, subj_num in enumerate(subject):
-            if subj == subj_num:
-                for index, item in enumerate(from_mask[subj_ind]):
-                    if item == 1:
-                        denom[index] += 1
-                        if to_mask[subj_ind][index] == 1:
-                            num[index] += 1
+        denom = [0] * len(from_mask[rows[-1]])
+        num = [0] * len(from_mask[rows[-1]])
+        for subj_ind in rows:
+            for index, item in enumerate(from_mask[subj_ind]):
+                if item == 1:
+                    denom[index] += 1
+                    if to_mask[subj_ind][index] == 1:
+                        num[index] += 1
         for index in range(len(denom)):
             if denom[index] != 0:
                 result.append(num[index] / float(denom[index]))
@@ -1,6 +1,7 @@
-import numpy as np
 from pybeh.pnr import pnr
+from pybeh.dataset import accepts_dataset
 
+@accepts_dataset
 def pfr(recalls, subjects, listLength):
     """"
     PFR   Probability of first recall.
@@ -12,7 +13,8 @@ def pfr(recalls, subjects, listLength):
     INPUTS:
         recalls:    a matrix whose elements are serial positions of recalled
                     items.  The rows of this matrix should represent recalls
-                    made by a single subject on a single trial.
+                    made by a single subject on a single trial. A
+                    RaggedArray of recalls may be passed instead.
 
         subjects:   a column vector which indexes the rows of recalls_matrix
                     with a subject number (or other identifier).  That is,
@@ -1,5 +1,9 @@
 import numpy as np
+from pybeh.ragged import RaggedArray
+from pybeh.dataset import accepts_dataset
+from pybeh.grouping import group_by
 
+@accepts_dataset
 def pnr(recalls, subjects, listLength, n=0):
     """
     PNR   Probability of nth recall.
@@ -11,7 +15,8 @@ def pnr(recalls, subjects, listLength, n=0):
     INPUTS:
         recalls:    a matrix whose elements are serial positions of recalled
                     items.  The rows of this matrix should represent recalls
-                    made by a single subject on a single trial.
+                    made by a single subject on a single trial. A
+                    RaggedArray of recalls may be passed instead.
 
         subjects:   a column vector which indexes the rows of recalls_matrix
                     with a subject number (or other identifier).  That is,
@@ -36,21 +41,14 @@ def pnr(recalls, subjects, listLength, n=0):
     if n >= listLength:
         raise ValueError('N must be less than the list length.')
 
-    recalls = np.array(recalls)
-    subjects = np.array(subjects)
-    usub = np.unique(subjects)
-    result = np.zeros((len(usub), listLength))
+    groups = group_by(subjects)
 
     # Get the Nth recall from each trial
-    nth_recs = np.array(recalls)[:, n]
-
-    for i, subj in enumerate(usub):
-        # Select only the trials from the current subject
-        subj_recs = nth_recs[subjects == subj]
-        # Count the number of times each serial position was recalled in output position N
-        for rec in subj_recs[subj_recs > 0]:
-            result[i, rec - 1] += 1
-        # Divide by the number of trials the participant completed
-        result[i] /= len(subj_recs)
-
-    return result
+    nth_recs = recalls.column(n) if isinstance(recalls, RaggedArray) else np.asarray(recalls)[:, n]
+
+    # Count the number of times each subject recalled each serial position in output position N
+    valid = (nth_recs > 0) & (nth_recs <= listLength)
+    counts = np.bincount(groups.index[valid] * listLength + nth_recs[valid].astype(int) - 1,
+                         minlength=groups.n_groups * listLength).reshape(groups.n_groups, listLength)
+    # Divide by the number of trials each participant completed
+    return counts / groups.counts[:, None]
@@ -1,8 +1,10 @@
 from __future__ import division
-import numpy as np
 import pybeh.mask_maker as mask
+from pybeh.dataset import accepts_dataset
+from pybeh.grouping import group_by
 
 
+@accepts_dataset(skip=['rec_mask'])
 def positional_crp(recalls=None, subject=None,  list_length=None, rec_mask=None):
     """
     POSITIONAL_CRP  Computes conditional response probabilities of recalling
@@ -48,23 +50,22 @@ def positional_crp(recalls=None, subject=None,  list_length=None, rec_mask=None)
         raise Exception('You must pass a list length.')
     elif len(recalls) != len(subject):
         raise Exception('recalls matrix must have the same number of rows as subjects.')
-    if rec_mask != None:
+    if rec_mask is not None:
         if len(rec_mask) != len(subject):
             raise Exception('rec_mask must have same shape a recall matrix.')
         else:
             recalls = mask.mask_data(rec_mask, rec_mask)
     result = []
-    subjects = np.unique(subject)
+    groups = group_by(subject)
 
-    for subj in subjects:
+    for group, rows in groups.segments():
         crp = [0] * (2 * list_length - 1)
         count = 0
-        for subj_ind, subj_num in enumerate(subject):
-            if subj == subj_num:
-                for index, item in enumerate(recalls[subj_ind]):
-                    if item > 0 and item < list_length + 1:
-                        crp[(index + 1) - item + list_length - 1] += 1
-                        count += 1
+        for subj_ind in rows:
+            for index, item in enumerate(recalls[subj_ind]):
+                if item > 0 and item < list_length + 1:
+                    crp[(index + 1) - item + list_length - 1] += 1
+                    count += 1
         for num, item in enumerate(crp):
             crp[num]  = item / float(count)
         result.append(crp)
@@ -0,0 +1,177 @@
+import numpy as np
+
+
+class RaggedArray(object):
+    """
+    A matrix whose rows have different lengths, stored without padding (compressed sparse row layout).
+
+    The elements of every row are stored one after another in a single values array, and the rows are delimited by an
+    offsets array: row i holds values[offsets[i]:offsets[i + 1]]. This is used for recall sequences (e.g. recalls, times,
+    rec_itemnos and intrusions from create_data), whose lengths vary from trial to trial. A padded matrix must be as wide
+    as the longest recall sequence, while a RaggedArray only stores the recalls that were made.
+
+    RaggedArrays can be passed in place of padded recall matrices to spc, pfr, pnr, crp, crl, temp_fact, reps, pli, xli
+    and TransitionTable. They can be built from padded matrices (see from_padded), or from long-format columns with one
+    row per recall (see long_format.long_data).
+
+    ATTRIBUTES:
+        values:     A 1D array of the elements of every row, in row order.
+        offsets:    A 1D array of length n_rows + 1, giving the start of each row in values, followed by len(values).
+    """
+
+    def __init__(self, values=None, offsets=None):
+        """
+        :param values: A 1D array of the elements of every row, in row order.
+        :param offsets: A 1D array of length n_rows + 1, giving the start of each row in values, followed by
+            len(values). Must start at 0 and be nondecreasing.
+        """
+        if values is None:
+            raise Exception('You must pass a values array.')
+        if offsets is None:
+            raise Exception('You must pass an offsets array.')
+        values = np.asarray(values)
+        offsets = np.asarray(offsets, dtype=np.intp)
+        if values.ndim != 1 or offsets.ndim != 1 or offsets.size < 1:
+            raise ValueError('values and offsets must be 1D arrays, and offsets must have at least one element.')
+        if offsets[0] != 0 or offsets[-1] != values.size or np.any(np.diff(offsets) < 0):
+            raise ValueError('offsets must be nondecreasing, starting at 0 and ending at len(values).')
+        self.values = values
+        self.offsets = offsets
+
+    @classmethod
+    def from_padded(cls, matrix=None, lengths=None, pad_value=0):
+        """
+        Builds a RaggedArray from a padded matrix.
+
+        :param matrix: A rows x columns matrix, with each row padded at the end.
+        :param lengths: (Optional) The number of elements to keep from each row. By default, each row is cut after its
+            last element that is not equal to pad_value.
+        :param pad_value: The value used for padding. NaN is supported. (DEFAULT = 0)
+
+        :return: A RaggedArray with one row per row of the matrix.
+        """
+        if matrix is None:
+            raise Exception('You must pass a matrix.')
+        matrix = np.asarray(matrix)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(len(matrix), -1)
+        cols = np.arange(matrix.shape[1])
+        if lengths is None:
+            is_pad = _is_pad(matrix, pad_value)
+            lengths = np.max(np.where(is_pad, 0, cols + 1), axis=1, initial=0)
+        lengths = np.asarray(lengths, dtype=np.intp)
+        if lengths.size != matrix.shape[0] or np.any(lengths > matrix.shape[1]):
+            raise ValueError('lengths must have one element per row, and be no greater than the number of columns.')
+        return cls(matrix[cols < lengths[:, None]], np.append(0, np.cumsum(lengths)))
+
+    @classmethod
+    def concatenate(cls, arrays):
+        """Stacks the rows of several RaggedArrays into a single RaggedArray."""
+        arrays = list(arrays)
+        if not arrays:
+            return cls(np.zeros(0), np.zeros(1))
+        lengths = np.concatenate([array.lengths for array in arrays])
+        return cls(np.concatenate([array.values for array in arrays]), np.append(0, np.cumsum(lengths)))
+
+    def __len__(self):
+        return self.offsets.size - 1
+
+    def __getitem__(self, key):
+        """
+        Returns a single row as an array if key is an integer. Otherwise, key (a slice, boolean mask or array of row
+        indices) selects rows, which are returned as a new RaggedArray.
+        """
+        if isinstance(key, (int, np.integer)):
+            row = np.arange(len(self))[key]
+            return self.values[self.offsets[row]:self.offsets[row + 1]]
+        rows = np.arange(len(self))[key]
+        lengths = self.lengths[rows]
+        offsets = np.append(0, np.cumsum(lengths))
+        starts = np.repeat(self.offsets[rows] - offsets[:-1], lengths)
+        return RaggedArray(self.values[starts + np.arange(offsets[-1])], offsets)
+
+    @property
+    def lengths(self):
+        """The number of elements in each row."""
+        return np.diff(self.offsets)
+
+    @property
+    def shape(self):
+        """The (rows, columns) shape of the padded matrix this array represents."""
+        return len(self), int(np.max(self.lengths, initial=0))
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    def row_ids(self):
+        """Returns the row of each element of values."""
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    def positions(self):
+        """Returns the position (column, starting from 0) of each element of values within its row."""
+        return np.arange(self.values.size) - np.repeat(self.offsets[:-1], self.lengths)
+
+    def column(self, j, pad_value=0):
+        """Returns column j of the padded matrix, with pad_value for the rows that have no more than j elements."""
+        result = np.full(len(self), pad_value, dtype=_padded_dtype(self.values, pad_value))
+        has_j = self.lengths > j
+        result[has_j] = self.values[self.offsets[:-1][has_j] + j]
+        return result
+
+    def to_padded(self, pad_value=0, width=None):
+        """
+        Returns the padded matrix this array represents, with width columns (by default, the length of the longest
+        row).
+        """
+        if width is None:
+            width = self.shape[1]
+        elif width < self.shape[1]:
+            raise ValueError('width must be at least the length of the longest row.')
+        matrix = np.full((len(self), width), pad_value, dtype=_padded_dtype(self.values, pad_value))
+        matrix[self.row_ids(), self.positions()] = self.values
+        return matrix
+
+
+def flatten(matrix):
+    """
+    Returns the elements of a padded matrix or a RaggedArray as flat arrays, so that analyses can treat both in the same
+    way.
+
+    :param matrix: A 2D matrix (padding included), or a RaggedArray.
+
+    :return: The elements in row order, the row of each element, and the position of each element within its row.
+    """
+    if isinstance(matrix, RaggedArray):
+        return matrix.values, matrix.row_ids(), matrix.positions()
+    matrix = np.asarray(matrix)
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(len(matrix), -1)
+    n_rows, n_cols = matrix.shape
+    return matrix.ravel(), np.repeat(np.arange(n_rows), n_cols), np.tile(np.arange(n_cols), n_rows)
+
+
+def first_occurrences(matrix):
+    """
+    Returns a boolean mask over the flattened elements of a padded matrix or a RaggedArray (see flatten), which is True
+    for the first occurrence of each distinct value within its row.
+    """
+    values, rows, _ = flatten(matrix)
+    _, codes = np.unique(values, return_inverse=True)
+    _, first = np.unique(rows * (np.max(codes, initial=0) + 1) + codes.ravel(), return_index=True)
+    mask = np.zeros(values.size, dtype=bool)
+    mask[first] = True
+    return mask
+
+
+def _padded_dtype(values, pad_value):
+    """Returns the dtype that can hold both values and pad_value, without upcasting values for numeric padding."""
+    if isinstance(pad_value, (str, bytes)):
+        return np.result_type(values.dtype, np.asarray(pad_value).dtype)
+    return np.result_type(values, pad_value)
+
+
+def _is_pad(matrix, pad_value):
+    if isinstance(pad_value, float) and np.isnan(pad_value):
+        return np.isnan(matrix)
+    return matrix == pad_value
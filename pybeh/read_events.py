@@ -0,0 +1,86 @@
+import numpy as np
+from .create_data import create_data
+
+# Fields read by create_data; fields that are missing from the file are skipped
+EVENT_FIELDS = ['subject', 'session', 'type', 'itemno', 'item', 'rectime']
+
+
+def read_events(path=None, subjects=None, sessions=None, trial_field=None, columns=None, format=None):
+    """
+    Reads free recall events from a Parquet or Feather file (or a directory of such files) into a record array that can
+    be passed to create_data or events2data.
+
+    Only the columns used by create_data are read, and only the rows of the requested subjects and sessions. The
+    subject and session filters are pushed down to the reader, so that Parquet row groups whose statistics rule them out
+    are skipped without being loaded. Only presentation (WORD) and recall (REC_WORD) events are kept.
+
+    Requires pyarrow.
+
+    INPUTS:
+        path:           path to a Parquet or Feather file, or to a directory of files. Directories partitioned by
+                        field (e.g. subject=LTP001/session=0/part.parquet) are supported.
+        subjects:       (optional) a list of subjects to read. By default, every subject is read.
+        sessions:       (optional) a list of sessions to read. By default, every session is read.
+        trial_field:    field specifying which trial an event belongs to (see create_data). (Default == 'trial')
+        columns:        (optional) a list of additional columns to read.
+        format:         'parquet' or 'feather'. By default, files ending in .feather, .arrow or .ipc are read as
+                        Feather and all other paths as Parquet.
+
+    OUTPUTS:
+        events:         a record array with one record per event. Text columns become string arrays, with missing
+                        values as empty strings.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError:
+        raise ImportError('read_events requires pyarrow. Install it with "pip install pyarrow".')
+
+    if path is None:
+        raise Exception('You must pass a path to an events file.')
+    if trial_field is None:
+        trial_field = 'trial'
+    if format is None:
+        format = 'feather' if str(path).lower().endswith(('.feather', '.arrow', '.ipc')) else 'parquet'
+
+    dataset = ds.dataset(path, format=format, partitioning='hive')
+    fields = EVENT_FIELDS + [trial_field] + (list(columns) if columns is not None else [])
+    fields = [field for i, field in enumerate(fields) if field in dataset.schema.names and field not in fields[:i]]
+
+    # Build the row filter, which the reader applies to row group statistics before loading any data
+    row_filter = ds.field('type').isin(['WORD', 'REC_WORD'])
+    if subjects is not None:
+        row_filter &= ds.field('subject').isin(list(subjects))
+    if sessions is not None:
+        row_filter &= ds.field('session').isin(list(sessions))
+    table = dataset.to_table(columns=fields, filter=row_filter)
+
+    return np.rec.fromarrays([_column(pa, table.column(field)) for field in fields], names=fields)
+
+
+def read_data(path=None, subjects=None, sessions=None, trial_field=None, format=None, n_jobs=None):
+    """
+    Reads free recall events from a Parquet or Feather file with read_events, and converts them into the data structure
+    described in create_data.
+
+    INPUTS:
+        path, subjects, sessions, trial_field, format:  see read_events
+        n_jobs:         number of worker processes used to convert subjects in parallel (see create_data).
+
+    OUTPUTS:
+        data:           the data structure described in create_data, for the requested subjects and sessions.
+    """
+    events = read_events(path, subjects=subjects, sessions=sessions, trial_field=trial_field, format=format)
+    return create_data(events, trial_field=trial_field, n_jobs=n_jobs)
+
+
+def _column(pa, column):
+    """Converts a pyarrow column into a numpy array, with text as a string array."""
+    if pa.types.is_dictionary(column.type):
+        column = pa.chunked_array([chunk.dictionary_decode() for chunk in column.chunks],
+                                  type=column.type.value_type)
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        return column.fill_null('').to_numpy().astype(str)
+    if pa.types.is_binary(column.type) or pa.types.is_large_binary(column.type):
+        return column.fill_null(b'').to_numpy().astype(bytes)
+    return column.to_numpy()
@@ -1,40 +1,53 @@
 import numpy as np
+from pybeh.chunks import as_matrix, row_chunks, take_rows
+from pybeh.ragged import flatten
+from pybeh.dataset import accepts_dataset
+from pybeh.grouping import group_by
 
 
-def reps(recalls, subjects, unique_reps=False, per_list=False):
+@accepts_dataset
+def reps(recalls, subjects, unique_reps=False, per_list=False, chunk_size=None):
     """
     Calculate's each partcipant's average number of repetitions per list.
 
-    :param recalls: A trials x items matrix whose elements are the serial positions of recalled items. Intrusions
+    :param recalls: A trials x items matrix (or a RaggedArray) whose elements are the serial positions of recalled
+    items. Intrusions
     :param subjects: A list of subject codes, indicating which subject produced each row of the intrusions matrix
     :param unique_reps: If True, counts the number of unique repetitions made. If False, counts all repetitions. For
     example, if a subject recalls the same word 3 times in a list, this counts as 2 repetitions if unique_reps is False,
     and only 1 repetition if unique_reps is True.
     :param per_list: If True, returns the average number of repetitions per list for each subject. If False, returns the
     total number of repetitions made by each subject.
+    :param chunk_size: (Optional) If given, the recalls matrix is processed this many rows at a time, which bounds peak
+    memory for very large (e.g. memory-mapped) matrices.
     :return: An array where each entry is the total or average (per list) number of repetitions for a participant.
     """
-    recalls = np.array(recalls)
-    subjects = np.array(subjects)
-    usub = np.unique(subjects)
-    result = np.zeros_like(usub, dtype=float)
+    recalls = as_matrix(recalls)
+    groups = group_by(subjects)
 
-    for i, subj in enumerate(usub):
-        cur_recs = recalls[subjects == subj]
-        for trial in cur_recs:
-            # Find the number of times each word was recalled during the current trial
-            times_recalled = np.array([np.sum(trial == rec) for rec in np.unique(trial) if rec > 0])
-            # Subtract 1 from the number of times each correct word was recalled in the list to give the number of
-            # repetitions of each correct word
-            repetitions = times_recalled - 1
-            # Sum the number of repetitions made in the current trial (either unique or any)
-            if unique_reps:
-                result[i] += np.sum(repetitions > 0)
-            else:
-                result[i] += repetitions.sum()
+    trial_reps = np.zeros(len(recalls), dtype=int)
+    for rows in row_chunks(len(recalls), chunk_size):
+        # Sort each trial's correct recalls by serial position, so that recalls of the same word are next to each other
+        values, trial, _ = flatten(take_rows(recalls, rows))
+        correct = values > 0
+        trial = trial[correct]
+        values = values[correct]
+        order = np.lexsort((values, trial))
+        trial = trial[order]
+        values = values[order]
+        # Every recall of a word after its first one is a repetition
+        is_rep = np.zeros(trial.size, dtype=bool)
+        is_rep[1:] = (trial[1:] == trial[:-1]) & (values[1:] == values[:-1])
+        if unique_reps:
+            # Only count the first repetition of each word
+            is_rep[1:] &= ~is_rep[:-1]
+        # Sum the number of repetitions made in each trial (either unique or any)
+        trial_reps[rows] = np.bincount(trial[is_rep], minlength=rows.stop - rows.start)
 
-        # If desired, convert the raw repetition counts to average repetitions per list
-        if per_list:
-            result[i] = result[i] / cur_recs.shape[0]
+    # Sum the repetitions made by each subject
+    result = groups.sum(trial_reps).astype(float)
+    # If desired, convert the raw repetition counts to average repetitions per list
+    if per_list:
+        result = result / groups.counts
 
-    return result
\ No newline at end of file
+    return result
@@ -0,0 +1,238 @@
+import hashlib
+import inspect
+import os
+import pickle
+import numpy as np
+
+# Default size limit of a result cache, in bytes
+DEFAULT_MAX_BYTES = 2 ** 30
+
+# Extension of the files holding cached results
+RESULT_EXTENSION = '.pkl'
+
+# The cache used by analyses, or None if caching is disabled (see enable_cache)
+_active = None
+
+
+class ResultCache(object):
+    """
+    Stores the results of analyses on local disk, keyed by a hash of their inputs (see call_key), so that repeating an
+    analysis on the same data with the same parameters loads its result instead of computing it again.
+
+    Each result is pickled to its own file in directory, named after its key. When the files exceed max_bytes, the least
+    recently used results are deleted until they fit. Reading a result marks it as used by updating the modification
+    time of its file, so several processes (e.g. notebooks and batch jobs) can share one cache directory.
+
+    Analyses use the cache enabled with enable_cache. A ResultCache can also be used directly, with get and put.
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param directory: The directory in which results are stored. It is created if it does not exist. By default,
+            results are stored in pybeh/results within $XDG_CACHE_HOME (or ~/.cache).
+        :param max_bytes: The size limit of the stored results, in bytes. (DEFAULT = 1 GiB)
+        """
+        if directory is None:
+            directory = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(os.path.join('~', '.cache')),
+                                     'pybeh', 'results')
+        if max_bytes is None or max_bytes < 0:
+            raise ValueError('max_bytes must be a nonnegative number of bytes.')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def get(self, key):
+        """
+        Returns whether a result is stored under key, and the result (or None if it is not stored).
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+        except FileNotFoundError:
+            return False, None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # A file from an incompatible version of a dependency (or a truncated file) is treated as missing
+            self._remove(path)
+            return False, None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return True, result
+
+    def put(self, key, result):
+        """Stores a result under key, then evicts the least recently used results if the cache is over its limit."""
+        path = self._path(key)
+        # The file is replaced in one step, so that other processes never read a partial result
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def evict(self, max_bytes=None):
+        """Deletes the least recently used results until the cache holds at most max_bytes (DEFAULT = self.max_bytes)."""
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if total <= max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        """Deletes every stored result."""
+        self.evict(0)
+
+    def size(self):
+        """Returns the total size of the stored results, in bytes."""
+        return sum(size for _, size, _ in self._entries())
+
+    def __len__(self):
+        return len(self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + RESULT_EXTENSION)
+
+    def _entries(self):
+        """Returns the path, size and last use of every stored result."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(RESULT_EXTENSION):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime_ns))
+        return entries
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def enable_cache(directory=None, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Caches the results of every analysis on disk from now on (see ResultCache), until disable_cache is called.
+
+    :param directory: The directory in which results are stored (see ResultCache).
+    :param max_bytes: The size limit of the stored results, in bytes. (DEFAULT = 1 GiB)
+
+    :return: The ResultCache.
+    """
+    global _active
+    _active = ResultCache(directory, max_bytes=max_bytes)
+    return _active
+
+
+def disable_cache():
+    """Stops caching the results of analyses. Results already stored are kept on disk."""
+    global _active
+    _active = None
+
+
+def active_cache():
+    """Returns the ResultCache enabled with enable_cache, or None if caching is disabled."""
+    return _active
+
+
+def cached_call(func, inputs, compute):
+    """
+    Returns the result of an analysis from the active cache, or computes and stores it if it is not cached. If caching
+    is disabled, the result is computed without hashing its inputs.
+
+    :param func: The analysis.
+    :param inputs: A function that takes no arguments and returns a dictionary of the arguments that determine the
+        result (see call_key). It is only called if caching is enabled.
+    :param compute: A function that takes no arguments and computes the result.
+    """
+    cache = _active
+    if cache is None:
+        return compute()
+    key = call_key(func, inputs())
+    found, result = cache.get(key)
+    if not found:
+        result = compute()
+        cache.put(key, result)
+    return result
+
+
+def call_key(func, inputs):
+    """
+    Returns the key of a call to an analysis: a hash of the name of the analysis, the version of pybeh, and the
+    fingerprint of each of its arguments.
+
+    :param func: The analysis.
+    :param inputs: A dictionary mapping argument names to their values.
+    """
+    from . import __version__
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update('{}.{}:{}'.format(func.__module__, func.__qualname__, __version__).encode('utf-8'))
+    for name in sorted(inputs):
+        digest.update(name.encode('utf-8'))
+        digest.update(fingerprint(inputs[name]).encode('ascii'))
+    return digest.hexdigest()
+
+
+def bound_arguments(func, args=(), kwargs=None):
+    """
+    Returns a dictionary of the arguments of a call to func, including the defaults of the arguments that were not
+    passed, so that calls passing the same values positionally, by keyword or by default get the same key.
+    """
+    bound = inspect.signature(func).bind_partial(*args, **(kwargs or {}))
+    bound.apply_defaults()
+    return dict(bound.arguments)
+
+
+def fingerprint(value):
+    """
+    Returns a hash of a value, e.g. the argument of an analysis. Arrays are hashed from their buffers (together with
+    their dtype and shape), and lists, tuples, dictionaries and objects (e.g. RaggedArray, Groups and TransitionTable)
+    from their elements or public attributes.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    _update(digest, value)
+    return digest.hexdigest()
+
+
+def _update(digest, value):
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes)):
+        digest.update(repr((type(value).__name__, value)).encode('utf-8'))
+    elif isinstance(value, (np.ndarray, np.generic)):
+        value = np.asarray(value)
+        digest.update(repr(('ndarray', value.dtype.descr, value.shape)).encode('utf-8'))
+        if value.dtype.hasobject:
+            digest.update(pickle.dumps(value.tolist(), protocol=pickle.HIGHEST_PROTOCOL))
+        else:
+            digest.update(np.ascontiguousarray(value).reshape(-1).view(np.uint8))
+    elif isinstance(value, (list, tuple)):
+        digest.update(repr((type(value).__name__, len(value))).encode('utf-8'))
+        for element in value:
+            _update(digest, element)
+    elif isinstance(value, dict):
+        digest.update(repr(('dict', len(value))).encode('utf-8'))
+        for key in sorted(value, key=repr):
+            _update(digest, key)
+            _update(digest, value[key])
+    elif isinstance(value, slice):
+        _update(digest, ('slice', value.start, value.stop, value.step))
+    elif callable(value) and hasattr(value, '__qualname__') and hasattr(value, '__module__'):
+        digest.update(repr(('function', value.__module__, value.__qualname__)).encode('utf-8'))
+    elif callable(value):
+        digest.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    elif hasattr(value, '__dict__'):
+        # Private attributes hold caches (e.g. the order of a Groups object), which do not change the value
+        attributes = {key: attribute for key, attribute in vars(value).items() if not key.startswith('_')}
+        digest.update(repr(('object', type(value).__module__, type(value).__qualname__)).encode('utf-8'))
+        _update(digest, attributes)
+    else:
+        digest.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
@@ -0,0 +1,96 @@
+import inspect
+from collections import OrderedDict
+from .dataset import RecallDataset
+from .crl import crl
+from .crp import crp
+from .dist_fact import dist_fact
+from .or_score import or_score
+from .p_stop_op import p_stop_op
+from .p_stop_perc import p_stop_perc
+from .p_trans import p_trans
+from .p_trans_op import p_trans_op
+from .pfr import pfr
+from .pli import pli
+from .pnr import pnr
+from .positional_crp import positional_crp
+from .reps import reps
+from .sem_crp import sem_crp
+from .serial_ratios import serial_ratios
+from .spc import spc
+from .temp_fact import temp_fact
+from .xli import xli
+
+# Analyses that run can compute, by name
+ANALYSES = OrderedDict([
+    ('spc', spc),
+    ('pfr', pfr),
+    ('pnr', pnr),
+    ('crp', crp),
+    ('crl', crl),
+    ('temp_fact', temp_fact),
+    ('dist_fact', dist_fact),
+    ('sem_crp', sem_crp),
+    ('reps', reps),
+    ('pli', pli),
+    ('xli', xli),
+    ('serial_ratios', serial_ratios),
+    ('positional_crp', positional_crp),
+    ('or_score', or_score),
+    ('p_trans', p_trans),
+    ('p_trans_op', p_trans_op),
+    ('p_stop_op', p_stop_op),
+    ('p_stop_perc', p_stop_perc),
+])
+
+# Analyses computed by run when none are requested
+DEFAULT_ANALYSES = ['spc', 'pfr', 'crp', 'crl', 'temp_fact', 'reps', 'pli', 'xli']
+
+
+def run(data=None, analyses=None, subject_field=None, **params):
+    """
+    Computes several analyses of the same data in one sweep, sharing the work they have in common.
+
+    The data are wrapped in a single RecallDataset (see dataset.RecallDataset), so the inputs are converted and the
+    trials are grouped by subject once, and the intermediates that several analyses need (the clean-recall masks, the
+    TransitionTable used by crp, crl, temp_fact, dist_fact and sem_crp, and the first recall of each word used by pli and
+    xli to exclude repetitions) are computed once, by the first analysis that uses them.
+
+    INPUTS:
+        data:           the data structure described in create_data, or a RecallDataset.
+        analyses:       (optional) a list of analyses to compute, given by name (see ANALYSES) or as functions that take
+                        a RecallDataset as their first argument. (Default == DEFAULT_ANALYSES)
+        subject_field:  the field (or tuple of fields) to group the trials by, if data is not a RecallDataset.
+                        (Default == 'subjid' if the data has that field, and 'subject' otherwise; see RecallDataset)
+        params:         parameters of the analyses, e.g. lag_num=5 or min_recs=3. A parameter is passed to every
+                        requested analysis that takes it. To give a parameter to a single analysis, pass a dictionary
+                        named after that analysis, e.g. pnr={'n': 2}, which takes precedence.
+
+    OUTPUTS:
+        results:        an ordered dictionary mapping the name of each analysis to its result. Results have one row per
+                        subject, in the order of dataset.groups.labels.
+    """
+    if data is None:
+        raise Exception('You must pass a data structure.')
+    dataset = data if isinstance(data, RecallDataset) else RecallDataset(data, subject_field=subject_field)
+    if analyses is None:
+        analyses = DEFAULT_ANALYSES
+
+    # Resolve every analysis and its parameters before computing any of them, so that errors are raised up front
+    plan = []
+    for analysis in analyses:
+        if callable(analysis):
+            name, func = analysis.__name__, analysis
+        elif analysis in ANALYSES:
+            name, func = analysis, ANALYSES[analysis]
+        else:
+            raise ValueError('Unknown analysis: ' + str(analysis) + '. Choose from ' + ', '.join(ANALYSES) + '.')
+        accepted = inspect.signature(func).parameters
+        kwargs = {key: value for key, value in params.items() if key in accepted and key not in ANALYSES}
+        if isinstance(params.get(name), dict):
+            kwargs.update(params[name])
+        plan.append((name, func, kwargs))
+
+    results = OrderedDict()
+    for name, func, kwargs in plan:
+        results[name] = func(dataset, **kwargs)
+    return results
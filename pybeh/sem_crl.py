@@ -1,8 +1,15 @@
 from __future__ import division
 import numpy as np
+from pybeh.dataset import accepts_dataset
+from pybeh.grouping import group_by
 
+@accepts_dataset
 def sem_crl(recalls = None, times = None, recalls_itemnos = None, pres_itemnos = None, subjects = None, sem_sims = None, n_bins = None, listLength = None):
-    """sanity check"""
+    """
+    Returns the mean semantic similarity and the mean inter-response time of the transitions in each of n_bins bins of
+    semantic similarity. Both are matrices with one row per subject (in the order of np.unique(subjects), or of the
+    labels of a Groups object) and one column per bin.
+    """
     if recalls_itemnos is None:
         raise Exception('You must pass a recalls-by-item-numbers matrix.')
     elif pres_itemnos is None:
@@ -18,42 +25,48 @@ def sem_crl(recalls = None, times = None, recalls_itemnos = None, pres_itemnos =
     elif len(recalls_itemnos) != len(subjects):
         raise Exception('recalls matrix must have the same number of rows as subjects.')
 
-    bin_times = [0] * n_bins
-    bin_counts = [0] * n_bins
-    bin_val = [0] * n_bins
-
     """find all values in similarity matrix"""
     all_val = [sem_sims[item1][item2] for item1 in range(len(sem_sims)) for item2 in range(len(sem_sims[0]))]
     all_val = np.sort(all_val)
     all_val = all_val[~np.isnan(all_val)]
     all_val = list(chunkIt(all_val, n_bins))
 
-    for subj in range(len(recalls)):
-        encounter = []
-        for sp in range(len(recalls[0])):
-            if recalls[subj][sp] > 0 and recalls[subj][sp] < listLength + 1 and recalls[subj][sp] not in encounter:
-                encounter.append(recalls[subj][sp])
-                if sp + 1 < len(recalls[0]):
-                    if recalls[subj][sp + 1] > 0 and recalls[subj][sp + 1] < listLength + 1 and (
-                        recalls[subj][sp + 1] != recalls[subj][sp]) and (recalls[subj][sp + 1] not in encounter):
-
-                        if np.isnan(sem_sims[(int)(recalls_itemnos[subj][sp] - 1)][(int)(recalls_itemnos[subj][sp + 1] - 1)]) != True:
-                            add_to_bin(sem_sims[int(recalls_itemnos[subj][sp] - 1)][int(recalls_itemnos[subj][sp + 1] - 1)],
-                                       times[subj][sp+1] - times[subj][sp], all_val, bin_val, bin_times, bin_counts)
-
-    bin_mean = [0] * n_bins
-    crl = [0] * n_bins
-
-    for index in range(n_bins):
-        if bin_times[index] == 0:
-            bin_mean[index] = 0
-        else:
-            bin_mean[index] = bin_val[index] / float(bin_counts[index])
-        if bin_counts[index] == 0:
-            crl[index] = 0
-        else:
-            crl[index] = bin_times[index] / float(bin_counts[index])
-    return bin_mean, crl
+    groups = group_by(subjects)
+    bin_means = []
+    crls = []
+    for group, rows in groups.segments():
+        bin_times = [0] * n_bins
+        bin_counts = [0] * n_bins
+        bin_val = [0] * n_bins
+
+        for subj in rows:
+            encounter = []
+            for sp in range(len(recalls[0])):
+                if recalls[subj][sp] > 0 and recalls[subj][sp] < listLength + 1 and recalls[subj][sp] not in encounter:
+                    encounter.append(recalls[subj][sp])
+                    if sp + 1 < len(recalls[0]):
+                        if recalls[subj][sp + 1] > 0 and recalls[subj][sp + 1] < listLength + 1 and (
+                            recalls[subj][sp + 1] != recalls[subj][sp]) and (recalls[subj][sp + 1] not in encounter):
+
+                            if np.isnan(sem_sims[(int)(recalls_itemnos[subj][sp] - 1)][(int)(recalls_itemnos[subj][sp + 1] - 1)]) != True:
+                                add_to_bin(sem_sims[int(recalls_itemnos[subj][sp] - 1)][int(recalls_itemnos[subj][sp + 1] - 1)],
+                                           times[subj][sp+1] - times[subj][sp], all_val, bin_val, bin_times, bin_counts)
+
+        bin_mean = [0] * n_bins
+        crl = [0] * n_bins
+
+        for index in range(n_bins):
+            if bin_times[index] == 0:
+                bin_mean[index] = 0
+            else:
+                bin_mean[index] = bin_val[index] / float(bin_counts[index])
+            if bin_counts[index] == 0:
+                crl[index] = 0
+            else:
+                crl[index] = bin_times[index] / float(bin_counts[index])
+        bin_means.append(bin_mean)
+        crls.append(crl)
+    return np.array(bin_means), np.array(crls)
 
 """helper function to chunk sequence into equally sized bins"""
 
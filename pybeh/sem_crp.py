@@ -1,87 +1,79 @@
 from __future__ import division
 import numpy as np
-from pybeh.mask_maker import make_clean_recalls_mask2d
+from pybeh.transitions import transition_chunks
+from pybeh.dataset import accepts_dataset
+from pybeh.grouping import group_by
 
 
-def sem_crp(recalls=None, recalls_itemnos=None, pres_itemnos=None, subjects=None, sem_sims=None, n_bins=10, listLength=None):
+@accepts_dataset
+def sem_crp(recalls=None, recalls_itemnos=None, pres_itemnos=None, subjects=None, sem_sims=None, n_bins=10, listLength=None,
+            transitions=None, chunk_size=None):
     """sanity check"""
-    if recalls_itemnos is None:
-        raise Exception('You must pass a recalls-by-item-numbers matrix.')
-    elif pres_itemnos is None:
-        raise Exception('You must pass a presentations-by-item-numbers matrix.')
-    elif sem_sims is None:
+    if transitions is None:
+        if recalls_itemnos is None:
+            raise Exception('You must pass a recalls-by-item-numbers matrix.')
+        elif pres_itemnos is None:
+            raise Exception('You must pass a presentations-by-item-numbers matrix.')
+    elif transitions.from_itemno is None or transitions.pres_itemnos is None:
+        raise Exception('The transition table must be built with rec_itemnos and pres_itemnos.')
+    if sem_sims is None:
         raise Exception('You must pass a semantic similarity matrix.')
     elif subjects is None:
         raise Exception('You must pass a subjects vector.')
     elif listLength is None:
-        raise Exception('You must pass a listLength')
-    elif len(recalls_itemnos) != len(subjects):
+        if transitions is None:
+            raise Exception('You must pass a listLength')
+        listLength = transitions.listLength
+    if transitions is None and len(recalls_itemnos) != len(subjects):
         raise Exception('recalls matrix must have the same number of rows as subjects.')
 
-    # Make sure that all input arrays and matrices are numpy arrays
-    recalls = np.array(recalls, dtype=int)
-    recalls_itemnos = np.array(recalls_itemnos, dtype=int)
-    pres_itemnos = np.array(pres_itemnos, dtype=int)
-    subjects = np.array(subjects)
-    sem_sims = np.array(sem_sims)
+    # Make sure that all input arrays and matrices are numpy arrays, without copying arrays
+    sem_sims = np.asarray(sem_sims)
 
-    # Set diagonal of the similarity matrix to nan
-    np.fill_diagonal(sem_sims, np.nan)
-    # Sort and split all similarities into equally sized bins
-    all_sim = sem_sims.flatten()
+    # Sort and split all similarities (leaving out the diagonal) into equally sized bins
+    off_diagonal = ~np.eye(*sem_sims.shape, dtype=bool)
+    all_sim = sem_sims[off_diagonal]
     all_sim = np.sort(all_sim[~np.isnan(all_sim)])
     bins = np.array_split(all_sim, n_bins)
     bins = [b[0] for b in bins]
-    # Convert the similarity matrix to bin numbers for easy bin lookup later
+    # Convert the similarity matrix to bin numbers for easy bin lookup later, treating the diagonal as missing
     bin_sims = np.digitize(sem_sims, bins) - 1
+    np.fill_diagonal(bin_sims, np.digitize(np.nan, bins) - 1)
 
-    # Convert recalled item numbers to the corresponding indices of the similarity matrix by subtracting 1
-    recalls_itemnos -= 1
-    pres_itemnos -= 1
+    groups = group_by(subjects)
+    usub, subj_idx = groups.labels, groups.index
+    actual = np.zeros(len(usub) * n_bins)
+    val = np.zeros(len(usub) * n_bins)
+    poss = np.zeros((len(usub), n_bins))
 
-    usub = np.unique(subjects)
-    bin_means = np.zeros((len(usub), n_bins))
-    crp = np.zeros((len(usub), n_bins))
-    # For each subject
-    for i, subj in enumerate(usub):
-        # Create a filter to select only the current subject's data
-        subj_mask = subjects == subj
-        subj_recalls = recalls[subj_mask]
-        subj_rec_itemnos = recalls_itemnos[subj_mask]
-        subj_pres_itemnos = pres_itemnos[subj_mask]
+    # Identify all transitions between correct recalls in each chunk of the matrices, unless this has been done already
+    for rows, chunk in transition_chunks(len(subjects), transitions, chunk_size, recalls, listLength,
+                                         rec_itemnos=recalls_itemnos, pres_itemnos=pres_itemnos):
+        # Convert recalled item numbers to the corresponding indices of the similarity matrix by subtracting 1
+        this_recno = chunk.from_itemno.astype(int) - 1
+        next_recno = chunk.to_itemno.astype(int) - 1
+        chunk_pres = chunk.pres_itemnos[:, :listLength].astype(int) - 1
+        subj = subj_idx[rows][chunk.trial]
 
-        # Create trials x items matrix where item j, k indicates whether the kth recall on trial j was a correct recall
-        clean_recalls_mask = np.array(make_clean_recalls_mask2d(subj_recalls))
+        # Lookup semantic similarity and its bin between current recall and next recall, then count the actual
+        # transitions and sum their similarities within each subject's bins
+        sim = np.where(this_recno == next_recno, np.nan, sem_sims[this_recno, next_recno])
+        b = subj * n_bins + bin_sims[this_recno, next_recno]
+        actual += np.bincount(b, minlength=len(usub) * n_bins)
+        val += np.bincount(b, weights=sim, minlength=len(usub) * n_bins)
 
-        # Setup counts for number of possible and actual transitions, as well as the sim value of actual transitions
-        actual = np.zeros(n_bins)
-        poss = np.zeros(n_bins)
-        val = np.zeros(n_bins)
+        # Lookup the similarity bins between the current recall and all not-yet-recalled words, and mark which bins
+        # each transition could have been made to
+        poss_bins = bin_sims[this_recno[:, None], chunk_pres[chunk.trial]]
+        in_poss = np.zeros((len(chunk), n_bins + 1), dtype=bool)
+        trans_ind = np.broadcast_to(np.arange(len(chunk))[:, None], poss_bins.shape)
+        in_poss[trans_ind[chunk.available], poss_bins[chunk.available]] = True
+        for b in range(n_bins):
+            poss[:, b] += np.bincount(subj[in_poss[:, b]], minlength=len(usub))
+    actual = actual.reshape(len(usub), n_bins)
+    val = val.reshape(len(usub), n_bins)
 
-        # For each of the current subject's trials
-        for j, trial_recs in enumerate(subj_recalls):
-            seen = set()
-            # For each recall on the current trial
-            for k, rec in enumerate(trial_recs[:-1]):
-                seen.add(rec)
-                # Only increment transition counts if the current and next recall are BOTH correct recalls
-                if clean_recalls_mask[j, k] and clean_recalls_mask[j, k+1]:
-                    this_recno = subj_rec_itemnos[j, k]
-                    next_recno = subj_rec_itemnos[j, k+1]
-                    # Lookup semantic similarity and its bin between current recall and next recall
-                    sim = sem_sims[this_recno, next_recno]
-                    b = bin_sims[this_recno, next_recno]
-                    actual[b] += 1
-                    val[b] += sim
-
-                    # Get a list of not-yet-recalled word numbers
-                    poss_rec = [subj_pres_itemnos[j][x] for x in range(listLength) if x+1 not in seen]
-                    # Lookup the similarity bins between the current recall and all possible correct recalls
-                    poss_trans = np.unique([bin_sims[this_recno, itemno] for itemno in poss_rec])
-                    for b in poss_trans:
-                        poss[b] += 1
-
-        crp[i, :] = actual / poss  # CRP is calculated as number of actual transitions / number of possible ones
-        bin_means[i, :] = val / actual  # Bin means are defined as the average similarity of actual transitions per bin
+    crp = actual / poss  # CRP is calculated as number of actual transitions / number of possible ones
+    bin_means = val / actual  # Bin means are defined as the average similarity of actual transitions per bin
 
     return bin_means, crp
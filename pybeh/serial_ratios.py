@@ -1,6 +1,9 @@
 import numpy as np
+from pybeh.dataset import accepts_dataset
+from pybeh.grouping import group_by
 
 
+@accepts_dataset
 def serial_ratios(recalls, subjects, min_recs):
     """
     Calculates the proportion of trials on which participants initiated recall by recalling the first min_recs items
@@ -19,14 +22,12 @@ def serial_ratios(recalls, subjects, min_recs):
     if len(recalls) != len(subjects):
         raise Exception('Recalls matrix must have the same number of rows as subjects.')
 
-    recalls = np.array(recalls)
-    subjects = np.array(subjects)
-    usub = np.unique(subjects)
-    results = np.zeros(len(usub))
+    recalls = np.asarray(recalls)
+    groups = group_by(subjects)
 
     # If min_recs is greater than the maximum number of recalls anyone made, just return an array of zeros.
     if min_recs > recalls.shape[1]:
-        return results
+        return np.zeros(groups.n_groups)
 
     # Determine whether the first min_recs recalls in each trial matched the first min_recs words presented, in order.
     # In other words, word 1 should be recalled at index 0, word 2 should be recalled at index 1, etc.
@@ -35,7 +36,4 @@ def serial_ratios(recalls, subjects, min_recs):
         serial = serial & (recalls[:, i] == i + 1)
 
     # Calculate the proportion of trials from each subject that demonstrate serial recall
-    for i, subj in enumerate(usub):
-        results[i] = np.mean(serial[subjects == subj])
-
-    return results
+    return groups.mean(serial)
@@ -1,13 +1,19 @@
 from __future__ import division
 import numpy as np
+from pybeh.chunks import as_matrix, row_chunks, take_rows
+from pybeh.ragged import RaggedArray, flatten
+from pybeh.dataset import accepts_dataset
+from pybeh.grouping import group_by
 
 
-def spc(recalls, subjects, listLength, start_position=None):
+@accepts_dataset
+def spc(recalls, subjects, listLength, start_position=None, chunk_size=None):
     """
     Serial position curve (recall probability by serial position).
 
     :param recalls: A trials x items matrix whose elements are the serial positions of the items recalled on each trial.
-        Item (i, j) should therefore be the serial position of the jth item recalled on trial i.
+        Item (i, j) should therefore be the serial position of the jth item recalled on trial i. A RaggedArray of
+        recalls may be passed instead.
     :param subjects: A 1D array indicating which subject (or other identifier) produced the data from each row of the
         recalls matrix, i.e., recall trials from subject S should be located in recalls[subjects == S, :].
     :param listLength: A scalar indicating the length of presented lists. Serial positions are assumed to range from
@@ -17,6 +23,8 @@ def spc(recalls, subjects, listLength, start_position=None):
         provided serial positions. For example, start_positions=1 will produce a serial position curve for trials where
         recall began from the first list item, and start_positions=[1, 2, 3] will produce an SPC for trials where recall
         began from any of the first three items.
+    :param chunk_size: (Optional) If given, the recalls matrix is processed this many rows at a time, which bounds peak
+        memory for very large (e.g. memory-mapped) matrices.
     :return: A 2D numpy array where each row is the average SPC from one subject. Rows will match the subject order
         produced by np.unique(subjects).
     """
@@ -25,26 +33,41 @@ def spc(recalls, subjects, listLength, start_position=None):
     if isinstance(start_position, int):
         start_position = [start_position]
 
-    # Convert inputs to numpy arrays if they are not already
-    recalls = np.array(recalls)
-    subjects = np.array(subjects)
-    # Get list of unique subjects
-    usub = np.unique(subjects)
+    # Convert inputs to numpy arrays if they are not already, without copying arrays
+    recalls = as_matrix(recalls)
+    # Group the trials by subject, giving the list of unique subjects and the position of each trial's subject in it
+    groups = group_by(subjects)
+    usub, subj_idx = groups.labels, groups.index
     # Create list of all possible serial positions (from 1 through list length)
     positions = np.arange(1, listLength+1)
 
-    # Calculate average SPC for each unique subject
-    result = np.full((len(usub), listLength), np.nan)
-    for i, subj in enumerate(usub):
-        # Select only the trials from the current subject
-        subj_recalls = recalls[(subjects == subj)]
+    # Count the trials, and the number of trials on which each serial position's item was recalled, for each subject
+    n_recalled = np.zeros(len(usub) * listLength)
+    n_trials = np.zeros(len(usub))
+    for rows in row_chunks(len(subjects), chunk_size):
+        chunk = take_rows(recalls, rows)
+        chunk_subj = subj_idx[rows]
+        # Create a matrix of ones and zeroes indicating whether each presented item was correctly recalled on each trial
+        values, trial, _ = flatten(chunk)
+        in_list = np.isin(values, positions)
+        recalled = np.zeros((len(chunk), listLength), dtype=bool)
+        recalled[trial[in_list], values[in_list].astype(int) - 1] = True
         # If filtering by recall start position, select only trials that match
         if hasattr(start_position, '__iter__'):
-            subj_recalls = subj_recalls[np.isin(subj_recalls[:, 0], start_position), :] if subj_recalls.shape[1] > 0 else []
-        if len(subj_recalls) > 0:
-            # Create a matrix of ones and zeroes indicating whether each presented item was correctly recalled
-            subj_recalled = np.array([np.isin(positions, trial_data) for trial_data in subj_recalls])
-            # Calculate the subject's SPC as the fraction of trials on which they recalled each serial position's item
-            result[i, :] = subj_recalled.mean(axis=0)
+            if isinstance(chunk, RaggedArray):
+                first_recalls = chunk.column(0)
+            else:
+                first_recalls = chunk[:, 0] if chunk.shape[1] > 0 else np.zeros(len(chunk))
+            matches = np.isin(first_recalls, start_position)
+            recalled = recalled[matches]
+            chunk_subj = chunk_subj[matches]
+        trial, pos = np.nonzero(recalled)
+        n_recalled += np.bincount(chunk_subj[trial] * listLength + pos, minlength=len(usub) * listLength)
+        n_trials += np.bincount(chunk_subj, minlength=len(usub))
+
+    # Calculate each subject's SPC as the fraction of trials on which they recalled each serial position's item
+    result = np.full((len(usub), listLength), np.nan)
+    has_trials = n_trials > 0
+    result[has_trials] = n_recalled.reshape(len(usub), listLength)[has_trials] / n_trials[has_trials, None]
 
     return result
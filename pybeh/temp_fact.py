@@ -1,14 +1,17 @@
 import numpy as np
-from pybeh.mask_maker import make_clean_recalls_mask2d
+from pybeh.transitions import percentile_ranks, transition_chunks
+from pybeh.dataset import accepts_dataset
+from pybeh.grouping import group_by
 
 
-def temp_fact(recalls=None, subjects=None, listLength=None, skip_first_n=0):
+@accepts_dataset
+def temp_fact(recalls=None, subjects=None, listLength=None, skip_first_n=0, transitions=None, chunk_size=None):
     """
     Returns the lag-based temporal clustering factor for each subject (Polyn, Norman, & Kahana, 2009).
 
     :param recalls: A trials x recalls matrix containing the serial positions (between 1 and listLength) of words
         recalled on each trial. Intrusions should appear as -1, and the matrix should be padded with zeros if the number
-        of recalls differs by trial.
+        of recalls differs by trial. A RaggedArray of recalls may be passed instead.
     :param subjects: A list/array containing identifiers (e.g. subject number) indicating which subject completed each
         trial.
     :param listLength: A positive integer indicating the number of items presented on each trial.
@@ -17,57 +20,44 @@ def temp_fact(recalls=None, subjects=None, listLength=None, skip_first_n=0):
         as early transitions often differ from later transition in terms of their clustering. Note that the first n
         recalls will still count as already recalled words for the purposes of determining which transitions are
         possible. (DEFAULT=0)
+    :param transitions: (Optional) A TransitionTable built from the recalls matrix. If given, recalls may be omitted and
+        the transitions are not enumerated again.
+    :param chunk_size: (Optional) If given, the recalls matrix is processed this many rows at a time, which bounds peak
+        memory for very large (e.g. memory-mapped) matrices. Ignored if transitions is given.
 
     :return: An array containing the temporal clustering factor score for each subject (sorted by alphabetical order).
     """
 
-    if recalls is None:
+    if recalls is None and transitions is None:
         raise Exception('You must pass a recalls matrix.')
     if subjects is None:
         raise Exception('You must pass a subjects vector.')
     if listLength is None:
-        raise Exception('You must pass a list length.')
-    if len(recalls) != len(subjects):
+        if transitions is None:
+            raise Exception('You must pass a list length.')
+        listLength = transitions.listLength
+    if transitions is None and len(recalls) != len(subjects):
         raise Exception('The recalls matrix must have the same number of rows as the list of subjects.')
     if not isinstance(skip_first_n, int) or skip_first_n < 0:
         raise ValueError('skip_first_n must be a nonnegative integer.')
 
-    # Convert recalls and subjects to numpy arrays if they are not arrays already
-    recalls = np.array(recalls)
-    subjects = np.array(subjects)
-
-    # Initialize range for possible next recalls, based on list length
-    possibles_range = range(1, listLength + 1)
-
-    # Initialize arrays to store each participant's results
-    usub = np.unique(subjects)
-    total = np.zeros_like(usub, dtype=float)
-    count = np.zeros_like(usub, dtype=float)
-
-    # Identify locations of all correct recalls (not PLI, ELI, or repetition)
-    clean_recalls_mask = np.array(make_clean_recalls_mask2d(recalls))
-
-    # Calculate temporal factor score for each trial
-    for i, trial_data in enumerate(recalls):
-        seen = set()
-        # Identify the current subject's index in usub to determine their position in the total and count arrays
-        subj_ind = np.where(usub == subjects[i])[0][0]
-        # Loop over the recalls on the current trial
-        for j, serialpos in enumerate(trial_data[:-1]):
-            seen.add(serialpos)
-            # Only count transition if both the current and next recalls are valid
-            if clean_recalls_mask[i, j] and clean_recalls_mask[i, j+1] and j >= skip_first_n:
-                # Identify possible transitions
-                possibles = np.array([abs(item - serialpos) for item in possibles_range if item not in seen])
-                # Identify actual transition
-                next_serialpos = trial_data[j + 1]
-                actual = abs(next_serialpos - serialpos)
-                # Find the proportion of transition lags that were larger than the actual transition
-                ptile_rank = temp_percentile_rank(actual, possibles)
-                # Add transition to the appropriate participant's score
-                if ptile_rank is not None:
-                    total[subj_ind] += ptile_rank
-                    count[subj_ind] += 1
+    # Initialize arrays to store each participant's results, and identify each trial's position in those arrays
+    groups = group_by(subjects)
+    usub, subj_idx = groups.labels, groups.index
+    total = np.zeros(usub.size)
+    count = np.zeros(usub.size)
+
+    # Identify all transitions between correct recalls (not PLI, ELI, or repetition) in each chunk of the recalls matrix,
+    # unless this has been done already
+    for rows, chunk in transition_chunks(len(subjects), transitions, chunk_size, recalls, listLength):
+        # Calculate temporal factor score for each transition, skipping the first n transitions of each trial
+        keep = chunk.after(skip_first_n)
+        ptile_ranks = temp_percentile_ranks(chunk.from_pos[keep], chunk.to_pos[keep], chunk.available[keep])
+        # Add each transition to its participant's score, skipping those without a meaningful percentile rank
+        scored = ~np.isnan(ptile_ranks)
+        subj = subj_idx[rows][chunk.trial[keep][scored]]
+        total += np.bincount(subj, weights=ptile_ranks[scored], minlength=usub.size)
+        count += np.bincount(subj, minlength=usub.size)
 
     # Find temporal factor scores as the participants' average transition scores
     count[count == 0] = np.nan
@@ -105,3 +95,38 @@ def temp_percentile_rank(actual, possible):
         ptile_rank = None
 
     return ptile_rank
+
+
+def temp_percentile_ranks(from_pos, to_pos, available):
+    """
+    Vectorized version of temp_percentile_rank, which scores many transitions at once.
+
+    Rather than sorting the possible transition distances, this counts the available serial positions that are within
+    each distance of the transition's starting position, using cumulative sums over the availability mask. Ties are
+    handled exactly as in temp_percentile_rank.
+
+    :param from_pos: An array of the serial positions transitioned from.
+    :param to_pos: An array of the serial positions transitioned to.
+    :param available: A transitions x listLength boolean mask, which is True for serial positions that had not yet been
+        recalled when each transition was made.
+
+    :return: An array containing the proportion of possible transitions that were more distant than each actual
+        transition, or NaN where no meaningful percentile rank exists.
+    """
+    n_trans, listLength = available.shape
+    rows = np.arange(n_trans)
+    # avail_before[n, j] is the number of available serial positions among 1 through j
+    avail_before = np.zeros((n_trans, listLength + 1), dtype=int)
+    np.cumsum(available, axis=1, out=avail_before[:, 1:])
+
+    def n_within(dist):
+        # Count the available serial positions that are no more than dist away from the starting position
+        return avail_before[rows, np.minimum(from_pos + dist, listLength)] - \
+            avail_before[rows, np.maximum(from_pos - dist - 1, 0)]
+
+    actual = np.abs(to_pos - from_pos)
+    n_possible = avail_before[:, listLength]
+    n_closer_or_equal = n_within(actual)
+    n_equal = n_closer_or_equal - n_within(actual - 1)
+
+    return percentile_ranks(n_possible - n_closer_or_equal, n_equal, n_possible)
@@ -0,0 +1,211 @@
+import numpy as np
+from pybeh.chunks import as_matrix, row_chunks, take_rows
+from pybeh.ragged import RaggedArray, flatten
+
+
+class TransitionTable(object):
+    """
+    Every valid recall transition in a recalls matrix, enumerated once so that it can be shared across analyses.
+
+    A transition from output position k to k + 1 of a trial is valid if both recalls are correct recalls, i.e. neither
+    is an intrusion, a repetition, or padding. Transitions are stored in flat arrays, sorted by trial and then by output
+    position. The table can be built from padded recall matrices or from RaggedArrays. The table can be passed to crp,
+    crl, temp_fact, dist_fact and sem_crp through their transitions argument, so that running several of them on the
+    same data does not repeat this work.
+
+    Transitions at the start of each trial are kept even if an analysis will skip them (see skip_first_n in the
+    analyses), since those analyses simply filter on output_pos.
+
+    ATTRIBUTES:
+        listLength:     The number of items presented on each trial.
+        n_trials:       The number of rows in the recalls matrix the table was built from.
+        trial:          The row of the recalls matrix each transition was made on.
+        output_pos:     The output position (starting from 0) of the recall each transition was made from.
+        from_pos:       The serial position (1 to listLength) transitioned from.
+        to_pos:         The serial position (1 to listLength) transitioned to.
+        irt:            The inter-response time of each transition, or None if no times were given.
+        available:      A transitions x listLength boolean mask, where available[n, p - 1] is True if serial position
+                        p had not yet been recalled when transition n was made. The to_pos of every transition is
+                        always available.
+        from_itemno:    The item number transitioned from, or None if no rec_itemnos were given.
+        to_itemno:      The item number transitioned to, or None if no rec_itemnos were given.
+        pres_itemnos:   The trials x items matrix of presented item numbers, or None if it was not given.
+    """
+
+    def __init__(self, recalls=None, listLength=None, times=None, rec_itemnos=None, pres_itemnos=None):
+        """
+        :param recalls: A trials x recalls matrix containing the serial positions (between 1 and listLength) of words
+            recalled on each trial. Intrusions should appear as -1, and the matrix should be padded with zeros if the
+            number of recalls differs by trial. A RaggedArray of recalls may be passed instead.
+        :param listLength: A positive integer indicating the number of items presented on each trial.
+        :param times: (Optional) A trials x recalls matrix (or RaggedArray) of the time at which each recall was made.
+        :param rec_itemnos: (Optional) A trials x recalls matrix (or RaggedArray) of the item numbers recalled on each
+            trial.
+        :param pres_itemnos: (Optional) A trials x items matrix of the item numbers presented on each trial.
+        """
+        if recalls is None:
+            raise Exception('You must pass a recalls matrix.')
+        if listLength is None:
+            raise Exception('You must pass a list length.')
+
+        if not isinstance(recalls, RaggedArray):
+            recalls = np.asarray(recalls)
+            if recalls.ndim != 2:
+                recalls = recalls.reshape(len(recalls), -1)
+        for name, matrix in (('times', times), ('rec_itemnos', rec_itemnos)):
+            if matrix is not None and _shape(matrix) != _shape(recalls):
+                raise Exception(name + ' matrix must have the same shape as the recalls matrix.')
+        if pres_itemnos is not None:
+            pres_itemnos = np.asarray(pres_itemnos)
+            if len(pres_itemnos) != len(recalls):
+                raise Exception('pres_itemnos matrix must have the same number of rows as the recalls matrix.')
+
+        self.listLength = listLength
+        self.n_trials = len(recalls)
+        self.pres_itemnos = pres_itemnos
+
+        # Flatten the recalls (padded or ragged) into one array of recalls, in order of trial and output position
+        values, rows, outputs = flatten(recalls)
+        serial_pos = _serial_positions(values, listLength)
+        # A recall is correct if it is a serial position that has not been recalled earlier on the same trial
+        in_list = np.flatnonzero(serial_pos > 0)
+        _, first = np.unique(rows[in_list] * listLength + serial_pos[in_list] - 1, return_index=True)
+        correct = np.zeros(values.size, dtype=bool)
+        correct[in_list[first]] = True
+
+        # Only keep transitions where the current and next recall are BOTH correct recalls on the same trial
+        start = np.flatnonzero(correct[:-1] & correct[1:] & (rows[:-1] == rows[1:]))
+        self.trial = rows[start]
+        self.output_pos = outputs[start]
+        self.from_pos = serial_pos[start]
+        self.to_pos = serial_pos[start + 1]
+
+        # A serial position is available until the output position at which it is first recalled
+        first_output = np.full((self.n_trials, listLength), np.iinfo(np.intp).max)
+        first_output[rows[correct], serial_pos[correct] - 1] = outputs[correct]
+        self.available = first_output[self.trial] > self.output_pos[:, None]
+
+        self.irt = None
+        if times is not None:
+            times = flatten(times)[0]
+            self.irt = times[start + 1] - times[start]
+        self.from_itemno = None
+        self.to_itemno = None
+        if rec_itemnos is not None:
+            rec_itemnos = flatten(rec_itemnos)[0]
+            self.from_itemno = rec_itemnos[start]
+            self.to_itemno = rec_itemnos[start + 1]
+
+    @classmethod
+    def from_itemnos(cls, rec_itemnos=None, pres_itemnos=None, times=None):
+        """
+        Builds a transition table from presented and recalled item numbers, rather than from a recalls matrix.
+
+        :param rec_itemnos: A trials x recalls matrix containing the item numbers recalled on each trial. Extra-list
+            intrusions should appear as -1, and the matrix should be padded with zeros if the number of recalls
+            differs by trial.
+        :param pres_itemnos: A trials x items matrix containing the item numbers presented on each trial.
+        :param times: (Optional) A trials x recalls matrix of the time at which each recall was made.
+
+        :return: A TransitionTable with item numbers attached.
+        """
+        # Imported here so that the recalls-based analyses do not depend on pandas
+        from pybeh.make_recalls_matrix import make_recalls_matrix
+
+        if rec_itemnos is None:
+            raise Exception('You must pass a rec_itemnos matrix.')
+        if pres_itemnos is None:
+            raise Exception('You must pass a pres_itemnos matrix.')
+        if not isinstance(rec_itemnos, RaggedArray):
+            rec_itemnos = np.asarray(rec_itemnos)
+        pres_itemnos = np.asarray(pres_itemnos)
+        recalls = make_recalls_matrix(pres_itemnos, rec_itemnos)
+        return cls(recalls, pres_itemnos.shape[1], times=times, rec_itemnos=rec_itemnos, pres_itemnos=pres_itemnos)
+
+    def __len__(self):
+        return self.trial.size
+
+    @property
+    def lag(self):
+        """The lag (to_pos - from_pos) of each transition."""
+        return self.to_pos - self.from_pos
+
+    def after(self, skip_first_n=0):
+        """
+        Returns a boolean mask over the transitions, which is False for the first skip_first_n transitions of each
+        trial.
+        """
+        return self.output_pos >= skip_first_n
+
+    def check_trials(self, n_trials):
+        """Raises an exception if the table was not built from a matrix with n_trials rows."""
+        if n_trials != self.n_trials:
+            raise Exception('The transition table must be built from a matrix with the same number of rows as '
+                            'subjects.')
+
+
+def transition_chunks(n_trials, transitions=None, chunk_size=None, recalls=None, listLength=None, times=None,
+                      rec_itemnos=None, pres_itemnos=None):
+    """
+    Yields the transition tables an analysis should process, with the rows of the recalls matrix each one covers.
+
+    If a transition table was passed to the analysis, it is checked and yielded as a single chunk. Otherwise, the rows
+    are split into chunks of at most chunk_size trials (see row_chunks), and a table is built for each chunk in turn,
+    so that only one chunk's transitions are held in memory at a time. Arrays are sliced without being copied.
+
+    :param n_trials: The number of trials (rows) the analysis covers.
+    :param transitions: (Optional) A TransitionTable passed to the analysis.
+    :param chunk_size: (Optional) The maximum number of trials per chunk. If None, all trials form a single chunk.
+    :param recalls, listLength, times, rec_itemnos, pres_itemnos: The matrices (and list length) to build the tables
+        from, as in TransitionTable. If recalls is None, the tables are built with TransitionTable.from_itemnos.
+
+    :return: A generator of (rows, table) pairs, where rows is a slice of the trials the table was built from.
+    """
+    if transitions is not None:
+        transitions.check_trials(n_trials)
+        yield slice(0, n_trials), transitions
+        return
+    recalls, times, rec_itemnos, pres_itemnos = map(as_matrix, (recalls, times, rec_itemnos, pres_itemnos))
+    for rows in row_chunks(n_trials, chunk_size):
+        if recalls is None:
+            yield rows, TransitionTable.from_itemnos(take_rows(rec_itemnos, rows), take_rows(pres_itemnos, rows),
+                                                     times=take_rows(times, rows))
+        else:
+            yield rows, TransitionTable(take_rows(recalls, rows), listLength, times=take_rows(times, rows),
+                                        rec_itemnos=take_rows(rec_itemnos, rows),
+                                        pres_itemnos=take_rows(pres_itemnos, rows))
+
+
+def percentile_ranks(n_farther, n_equal, n_possible):
+    """
+    Returns the percentile rank of each actual transition among the transitions that could have been made, given
+    counts of the possible transitions that were more distant than, and as distant as, the actual one.
+
+    Possible transitions are ranked from most to least distant. If several were as distant as the actual transition,
+    the actual transition gets the average of their ranks. The rank is then converted to the proportion of the other
+    possible transitions that were more distant than the actual transition.
+
+    :param n_farther: An array with the number of possible transitions more distant than each actual transition.
+    :param n_equal: An array with the number of possible transitions as distant as each actual transition (including
+        the actual transition itself).
+    :param n_possible: An array with the total number of possible transitions.
+
+    :return: An array of percentile ranks. Transitions with fewer than 2 possible transitions, or for which the actual
+        transition did not match any possible transition, are NaN.
+    """
+    ptile_ranks = np.full(len(n_possible), np.nan)
+    valid = (n_possible >= 2) & (n_equal > 0)
+    ptile_ranks[valid] = (n_farther[valid] + (n_equal[valid] - 1) / 2.) / (n_possible[valid] - 1.)
+    return ptile_ranks
+
+
+def _serial_positions(values, listLength):
+    """Returns the serial positions in values as integers, with any value outside 1 to listLength set to 0."""
+    return np.where((values > 0) & (values <= listLength), values, 0).astype(int)
+
+
+def _shape(matrix):
+    """Returns the shape of a padded matrix, or the row lengths of a RaggedArray."""
+    if isinstance(matrix, RaggedArray):
+        return tuple(matrix.lengths)
+    return np.shape(matrix)
@@ -1,7 +1,13 @@
 import numpy as np
+from pybeh.chunks import as_matrix, row_chunks, take_rows
+from pybeh.ragged import first_occurrences, flatten
+from pybeh.dataset import accepts_dataset
+from pybeh.grouping import group_by
 
 
-def xli(intrusions, subjects, rec_items=None, exclude_reps=False, per_list=False):
+@accepts_dataset
+def xli(intrusions, subjects, rec_items=None, exclude_reps=False, per_list=False, chunk_size=None,
+        first_items=None):
     """
     XLI   Number of extra list intrusions.
 
@@ -11,7 +17,7 @@ def xli(intrusions, subjects, rec_items=None, exclude_reps=False, per_list=False
         intrusions:     matrix whose elements indicate PLI if
                         equal to positive integer, where the integer indicates
                         number of lists prior. Indicates XLI if
-                        equal to -1.
+                        equal to -1. A RaggedArray may be passed instead.
 
         subjects:       column vector which indexes the rows of
                         recall_itemnos with a subject number (or other
@@ -32,6 +38,18 @@ def xli(intrusions, subjects, rec_items=None, exclude_reps=False, per_list=False
                         counts should be returned. Returns raw counts if False,
                         average count per list if True. (Default == False)
 
+        chunk_size:     (Optional) If given, the intrusions and rec_items
+                        matrices are processed this many rows at a time, which
+                        bounds peak memory for very large (e.g. memory-mapped)
+                        matrices.
+
+        first_items:    (Optional) A boolean matrix (or RaggedArray) with the
+                        shape of rec_items, which is True for the first
+                        recall of each word on its trial. If given, it is used
+                        in place of rec_items to exclude repetitions, so that it
+                        can be computed once and shared with other analyses
+                        (see RecallDataset.first_items).
+
     OUTPUTS:
         xlis:           vector of total number of XLIs. Its rows are indexed
                         by subject.
@@ -47,34 +65,36 @@ def xli(intrusions, subjects, rec_items=None, exclude_reps=False, per_list=False
         raise Exception('per_list must be True or False.')
     if not isinstance(exclude_reps, bool):
         raise Exception('exclude_reps must be True or False.')
-    if exclude_reps and rec_items is None:
+    if exclude_reps and rec_items is None and first_items is None:
         raise Exception('rec_items must be provided in order to exclude repetitions.')
 
-    subjects = np.array(subjects)
-    # Get list of unique participants (or other trial identifier)
-    usub = np.unique(subjects)
-    # XLIs are any -1 in the intrusions matrix
-    xlis = np.array(intrusions) == -1
-
-    if exclude_reps:
-        rec_items = np.array(rec_items)
-        result = np.zeros_like(usub, dtype=float)
-        for i, subj in enumerate(usub):
-            # Get XLI map from current subject
-            cur_xlis = xlis[subjects == subj]
-            cur_recs = rec_items[subjects == subj]
-            for j, row in enumerate(cur_xlis):
-                # Identify the index of the first occurrence of each unique recall in a trial
-                _, indx = np.unique(cur_recs[j], return_index=True)
-                # Count the number of unique XLIs using these indices
-                result[i] += np.sum(row[indx])
-            # Convert raw counts to average XLIs per trial if desired
-            if per_list:
-                result[i] = result[i] / cur_xlis.shape[0]
-        result = result.tolist()
-    else:
-        # Count the XLIs from each subject
-        result = [np.sum(xlis[subjects == subj, :]) for subj in usub] if not per_list \
-            else [np.sum(xlis[subjects == subj, :]) / xlis[subjects == subj].shape[0] for subj in usub]
+    intrusions = as_matrix(intrusions)
+    rec_items = as_matrix(rec_items)
+    first_items = as_matrix(first_items)
+    # Group the trials by participant (or other trial identifier)
+    groups = group_by(subjects)
+
+    trial_xlis = np.zeros(len(intrusions), dtype=int)
+    for rows in row_chunks(len(intrusions), chunk_size):
+        # XLIs are any -1 in the intrusions matrix
+        values, trial, _ = flatten(take_rows(intrusions, rows))
+        xlis = values == -1
+        if exclude_reps:
+            # Only count the first occurrence of each unique recall in a trial
+            if first_items is not None:
+                first = flatten(take_rows(first_items, rows))[0].astype(bool)
+            else:
+                first = first_occurrences(take_rows(rec_items, rows))
+            if first.size != values.size:
+                raise Exception('rec_items must have the same shape as the intrusions matrix.')
+            xlis &= first
+        # Count the XLIs made on each trial
+        trial_xlis[rows] = np.bincount(trial[xlis], minlength=rows.stop - rows.start)
+
+    # Count the XLIs from each subject, and convert raw counts to average XLIs per trial if desired
+    result = groups.sum(trial_xlis)
+    if per_list:
+        result = result / groups.counts
+    result = result.astype(float).tolist() if exclude_reps else list(result)
 
     return result
@@ -1,4 +1,4 @@
-from distutils.core import setup
+from setuptools import setup
 
 setup(
         name='pybeh',
@@ -8,5 +8,8 @@ setup(
         license='MIT',
         author='jkragel',
         author_email='jkragel@sas.upenn.edu',
-        description='behavioral toolbox in python'
+        description='behavioral toolbox in python',
+        entry_points={
+            'console_scripts': ['pybeh = pybeh.cli:main'],
+        },
 )